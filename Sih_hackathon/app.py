@@ -1,24 +1,45 @@
+import asyncio
+import functools
 import io
+import json
+import multiprocessing
+import os
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List
+
 import torch
+import torchvision
 import torchvision.transforms as transforms
-from fastapi import FastAPI, File, UploadFile
-from PIL import Image
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from PIL import Image, UnidentifiedImageError
 from torchvision.models import resnet101
 
+from backends import build_backend, check_parity, export_onnx, load_sample_batches
+from batching import MicroBatcher
+from cache import PredictionCache
+from guidance import GuidanceIndex
+from metrics import Counter, Gauge, Histogram, Registry
+from preprocessing import CROP_SIZE, decode_image, preprocess_into, preprocess_tiles
+from weights import assign_state_dict, convert_checkpoint, load_mapped_state_dict, safetensors_path
+
 # Initialize FastAPI app
 app = FastAPI(title="Plant Disease Detection API")
 
-# Load the model
-MODEL_PATH = "model/ResNet_101_ImageNet_plant-model-84.pth"
+# The model is loaded in the background on startup (see load_model); the
+# .pth checkpoint is converted once to safetensors at WEIGHTS_PATH so the
+# weights can be memory-mapped and shared between worker processes
+MODEL_PATH = os.environ.get("MODEL_PATH", "model/ResNet_101_ImageNet_plant-model-84.pth")
+WEIGHTS_PATH = os.environ.get("WEIGHTS_PATH", safetensors_path(MODEL_PATH))
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-model = resnet101(pretrained=False)
-# Adjust the final fully connected layer according to your number of classes
 num_classes = 20  # Change this to match your model's output classes
-model.fc = torch.nn.Linear(model.fc.in_features, num_classes)
-model.load_state_dict(torch.load(MODEL_PATH, map_location=device))
-model.to(device)
-model.eval()
 
 # Define the image transformations
 transform = transforms.Compose([
@@ -42,24 +63,597 @@ class_labels = [
     "Walnut Eriophyies erineus", "Walnut Gnomonialeptostyla",
 ]
 
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    # Read and preprocess the image
-    image_data = await file.read()
-    image = Image.open(io.BytesIO(image_data)).convert('RGB')
-    image_tensor = transform(image).unsqueeze(0).to(device)
-
-    # Make prediction
+# Micro-batching: concurrent requests are stacked into one forward pass
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.environ.get("MAX_WAIT_MS", "5"))
+
+# Worker pools: decode/transform runs on WORKER_POOL ("thread" or "process"),
+# forward passes on a single dedicated thread (torch parallelises internally)
+WORKER_POOL = os.environ.get("WORKER_POOL", "thread")
+WORKER_POOL_SIZE = int(os.environ.get("WORKER_POOL_SIZE", str(os.cpu_count() or 1)))
+
+# Admission control: requests beyond MAX_INFLIGHT are rejected with 503
+MAX_INFLIGHT = int(os.environ.get("MAX_INFLIGHT", "64"))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "1"))
+
+# /predict/batch: images from one request that may be in flight at once
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(MAX_BATCH_SIZE * 2)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Prediction cache keyed by a hash of the uploaded bytes; CACHE_DB adds a
+# SQLite tier that survives restarts, CACHE_TENSOR_KEYS also keys on the
+# preprocessed tensor so files that differ only in bytes that don't change
+# the pixels (e.g. stripped or edited metadata) skip inference; re-encoded
+# copies decode to different pixels and still miss
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.environ["CACHE_TTL_SECONDS"]) if os.environ.get("CACHE_TTL_SECONDS") else None
+CACHE_DB = os.environ.get("CACHE_DB")
+CACHE_TENSOR_KEYS = os.environ.get("CACHE_TENSOR_KEYS", "0") == "1"
+
+# Fast preprocessing (JPEG draft decoding and a fused resize/crop/normalize)
+# instead of the torchvision transform chain, see preprocessing.py
+FAST_PREPROCESS = os.environ.get("FAST_PREPROCESS", "1") == "1"
+
+# Inference backend: eager, dynamic_int8, static_int8, torchscript, compile
+# or onnx. PARITY_SAMPLE_DIR holds images used to compare it against fp32,
+# CALIBRATION_DIR images used to calibrate static_int8
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "eager")
+PARITY_SAMPLE_DIR = os.environ.get("PARITY_SAMPLE_DIR")
+CALIBRATION_DIR = os.environ.get("CALIBRATION_DIR")
+ONNX_PATH = os.environ.get("ONNX_PATH", os.path.splitext(MODEL_PATH)[0] + ".onnx")
+
+# Confidence reporting: predictions whose softmax probability is below
+# UNCERTAIN_THRESHOLD are flagged as uncertain
+UNCERTAIN_THRESHOLD = float(os.environ.get("UNCERTAIN_THRESHOLD", "0.5"))
+
+# Cascade: a small model (CASCADE_ARCH from torchvision, weights at
+# CASCADE_MODEL_PATH) answers images it is at least CASCADE_THRESHOLD sure
+# about; the rest of the batch is escalated to ResNet-101
+CASCADE_MODEL_PATH = os.environ.get("CASCADE_MODEL_PATH")
+CASCADE_ARCH = os.environ.get("CASCADE_ARCH", "mobilenet_v3_small")
+CASCADE_THRESHOLD = float(os.environ.get("CASCADE_THRESHOLD", "0.9"))
+
+# Treatment guidance precomputed per class by guidance.py, returned with a
+# prediction when the request asks for it
+GUIDANCE_INDEX = os.environ.get("GUIDANCE_INDEX", "guidance_index.json")
+
+# Profiling: every PROFILE_EVERY_N-th batch runs under torch.profiler and its
+# Chrome trace is written to PROFILE_DIR (0 disables)
+PROFILE_EVERY_N = int(os.environ.get("PROFILE_EVERY_N", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+# Tiled inference (/predict?tiled=true): the center crop plus overlapping
+# 224px tiles from a downsampled pyramid, at most MAX_TILES per image, run as
+# one batch. Tile scores are combined per class by TILE_AGGREGATION ("max" or
+# "mean") and the predicted class's tile scores are returned as a
+# HEATMAP_SIZE x HEATMAP_SIZE grid over the image
+MAX_TILES = int(os.environ.get("MAX_TILES", "32"))
+TILE_AGGREGATION = os.environ.get("TILE_AGGREGATION", "max")
+HEATMAP_SIZE = int(os.environ.get("HEATMAP_SIZE", "8"))
+
+def decode_upload(image_data):
+    if FAST_PREPROCESS:
+        return decode_image(image_data)
+    return Image.open(io.BytesIO(image_data)).convert('RGB')
+
+def transform_image(image):
+    if FAST_PREPROCESS:
+        return preprocess_into(image, torch.empty(3, CROP_SIZE, CROP_SIZE, dtype=torch.float32))
+    return transform(image)
+
+def preprocess_image(image_data):
+    return transform_image(decode_upload(image_data))
+
+def preprocess_image_timed(image_data):
+    # Runs on the preprocessing pool, possibly in another process, so the
+    # stage timings are returned and recorded by the caller
+    start = time.perf_counter()
+    image = decode_upload(image_data)
+    decoded = time.perf_counter()
+    tensor = transform_image(image)
+    return tensor, decoded - start, time.perf_counter() - decoded
+
+model = None
+forward = None
+cascade_model = None
+parity_report = None
+cascade_stats = {"answered_by_cascade": 0, "escalated": 0}
+model_ready = threading.Event()
+model_error = None
+model_lock = threading.Lock()
+
+def build_model(target_device):
+    # Build on the meta device to skip random initialisation, then point
+    # the parameters at the memory-mapped weights
+    with torch.device("meta"):
+        net = resnet101(pretrained=False)
+        # Adjust the final fully connected layer according to your number of classes
+        net.fc = torch.nn.Linear(net.fc.in_features, num_classes)
+    assign_state_dict(net, load_mapped_state_dict(WEIGHTS_PATH))
+    net.to(target_device)
+    net.eval()
+    return net
+
+def prepare_files():
+    # Writes the files load_model reads (converted weights, the exported ONNX
+    # graph) once, so worker processes started afterwards only read them
+    if not os.path.exists(WEIGHTS_PATH):
+        convert_checkpoint(MODEL_PATH, WEIGHTS_PATH)
+    if INFERENCE_BACKEND == "onnx" and not os.path.exists(ONNX_PATH):
+        export_onnx(build_model(torch.device("cpu")), ONNX_PATH)
+
+def load_model():
+    global model, forward, cascade_model, parity_report
+    with model_lock:
+        if model is not None:
+            return
+
+        if not os.path.exists(WEIGHTS_PATH):
+            convert_checkpoint(MODEL_PATH, WEIGHTS_PATH)
+        net = build_model(device)
+
+        print(f"Building {INFERENCE_BACKEND} inference backend")
+        forward = build_backend(
+            INFERENCE_BACKEND,
+            net,
+            device,
+            calibration_batches=load_sample_batches(CALIBRATION_DIR, preprocess_image) if CALIBRATION_DIR else None,
+            onnx_path=ONNX_PATH,
+        )
+        if PARITY_SAMPLE_DIR and INFERENCE_BACKEND != "eager":
+            parity_report = check_parity(net, forward, load_sample_batches(PARITY_SAMPLE_DIR, preprocess_image), device)
+            print(f"Parity of {INFERENCE_BACKEND} against fp32: {parity_report}")
+
+        if CASCADE_MODEL_PATH:
+            small = getattr(torchvision.models, CASCADE_ARCH)(num_classes=num_classes)
+            small.load_state_dict(torch.load(CASCADE_MODEL_PATH, map_location=device))
+            small.to(device)
+            small.eval()
+            cascade_model = small
+
+        model = net
+
+def warm_up():
+    # Run the batch sizes we expect to see so lazy initialisation (allocator
+    # pools, oneDNN primitives, compiled graphs) happens before traffic
+    for batch_size in sorted({1, MAX_BATCH_SIZE}):
+        run_batch(torch.zeros(batch_size, 3, 224, 224))
+
+def prepare_model():
+    global model_error
+    try:
+        load_model()
+        warm_up()
+        model_ready.set()
+        print("Model loaded and warmed up")
+    except Exception as e:
+        model_error = repr(e)
+        print(f"Error loading model: {model_error}")
+
+batches_run = 0
+
+def run_batch(batch):
+    global batches_run
+    batches_run += 1
+    if not PROFILE_EVERY_N or batches_run % PROFILE_EVERY_N:
+        return forward_batch(batch)
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True) as profiler:
+        outputs = forward_batch(batch)
+    profiler.export_chrome_trace(os.path.join(PROFILE_DIR, f"batch-{os.getpid()}-{batches_run}.json"))
+    return outputs
+
+def forward_batch(batch):
+    batch = batch.to(device)
     with torch.no_grad():
-        outputs = model(image_tensor)
-        _, predicted = torch.max(outputs, 1)
-
-    # Get the predicted class label
-    predicted_class = class_labels[predicted.item()]
+        if cascade_model is None:
+            return forward(batch).cpu()
+
+        outputs = cascade_model(batch).float()
+        confident = torch.softmax(outputs, 1).max(1).values >= CASCADE_THRESHOLD
+        escalate = (~confident).nonzero().flatten()
+        if len(escalate):
+            outputs[escalate] = forward(batch[escalate]).float()
+        cascade_stats["escalated"] += len(escalate)
+        cascade_stats["answered_by_cascade"] += len(batch) - len(escalate)
+    return outputs.cpu()
+
+# Metrics, exposed in Prometheus text format at /metrics. With METRICS_DIR
+# set (serve.py sets it for its workers) a scrape of any worker process
+# aggregates the metrics of all of them
+registry = Registry(multiprocess_dir=os.environ.get("METRICS_DIR"))
+stage_seconds = registry.register(Histogram(
+    "prediction_stage_seconds", "Time spent per prediction stage", ("stage",)
+))
+batch_size_histogram = registry.register(Histogram(
+    "inference_batch_size", "Images per forward pass", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+))
+predictions_total = registry.register(Counter(
+    "predictions_total", "Predictions returned per class", ("predicted_class",)
+))
+rejected_total = registry.register(Counter(
+    "rejected_requests_total", "Requests rejected with 503", ("reason",)
+))
+
+def record_batch(batch_size, queue_waits, seconds):
+    batch_size_histogram.observe(batch_size)
+    stage_seconds.observe(seconds, stage="forward")
+    for wait in queue_waits:
+        stage_seconds.observe(wait, stage="queue_wait")
+
+batcher = MicroBatcher(run_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, on_batch=record_batch)
+prediction_cache = PredictionCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    disk_path=CACHE_DB,
+    namespace=f"{MODEL_PATH}:{INFERENCE_BACKEND}:{CASCADE_MODEL_PATH}:{CASCADE_THRESHOLD}",
+)
+preprocess_pool = None
+inference_pool = None
+inflight = 0
+
+registry.register(Gauge("batch_queue_depth", "Images waiting for a forward pass", lambda: batcher.queue_depth))
+registry.register(Gauge("inflight_requests", "Requests currently admitted", lambda: inflight))
+registry.register(Gauge(
+    "prediction_cache_hits_total", "Prediction cache hits (memory and disk)",
+    lambda: prediction_cache.hits + prediction_cache.disk_hits, kind="counter",
+))
+registry.register(Gauge(
+    "prediction_cache_misses_total", "Prediction cache misses", lambda: prediction_cache.misses, kind="counter",
+))
+registry.register(Gauge(
+    "prediction_cache_hit_ratio", "Prediction cache hit rate", lambda: prediction_cache.stats()["hit_rate"],
+))
+guidance_index = GuidanceIndex(GUIDANCE_INDEX)
+# Futures for uncached images currently being scored, so identical
+# concurrent uploads share a single forward pass
+pending_predictions = {}
+
+def acquire_slot():
+    global inflight
+    if not model_ready.is_set():
+        rejected_total.inc(reason="not_ready")
+        raise HTTPException(
+            status_code=503,
+            detail="Model not loaded yet" if model_error is None else f"Model failed to load: {model_error}",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    if inflight >= MAX_INFLIGHT:
+        rejected_total.inc(reason="overloaded")
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, retry later",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    inflight += 1
+
+def release_slot():
+    global inflight
+    inflight -= 1
+
+@contextmanager
+def admission():
+    acquire_slot()
+    try:
+        yield
+    finally:
+        release_slot()
+
+async def cache_get(key):
+    # The memory tier is checked inline; misses go to the SQLite tier on a
+    # worker thread so disk reads never block the event loop
+    cached = prediction_cache.get_memory(key)
+    if cached is None and prediction_cache.disk_path:
+        cached = await asyncio.get_running_loop().run_in_executor(None, prediction_cache.get_disk, key)
+    return cached
+
+async def predict_image(image_data):
+    key = prediction_cache.key(image_data)
+    cached = await cache_get(key)
+    if cached is not None:
+        return torch.tensor(cached)
+
+    return await single_flight(key, lambda: _score_uncached(key, image_data))
+
+async def single_flight(key, score):
+    # Concurrent requests for the same key share one computation
+    if key in pending_predictions:
+        return await asyncio.shield(pending_predictions[key])
+
+    future = asyncio.ensure_future(score())
+    pending_predictions[key] = future
+    try:
+        return await asyncio.shield(future)
+    finally:
+        if future.done():
+            pending_predictions.pop(key, None)
+        else:
+            future.add_done_callback(lambda _: pending_predictions.pop(key, None))
+
+async def _score_uncached(key, image_data):
+    loop = asyncio.get_running_loop()
+    # "preprocess" includes waiting for a pool worker; "decode" and
+    # "transform" are the time spent in each step on the worker
+    with stage_seconds.time(stage="preprocess"):
+        image_tensor, decode_seconds, transform_seconds = await loop.run_in_executor(
+            preprocess_pool, preprocess_image_timed, image_data
+        )
+    stage_seconds.observe(decode_seconds, stage="decode")
+    stage_seconds.observe(transform_seconds, stage="transform")
+
+    tensor_key = None
+    if CACHE_TENSOR_KEYS:
+        tensor_key = prediction_cache.key(image_tensor.numpy().tobytes())
+        cached = await cache_get(tensor_key)
+        if cached is not None:
+            prediction_cache.put(key, cached)
+            return torch.tensor(cached)
+
+    outputs = await batcher.submit(image_tensor)
+    prediction_cache.put(key, outputs.tolist())
+    if tensor_key is not None:
+        prediction_cache.put(tensor_key, outputs.tolist())
+    return outputs
+
+async def predict_tiled(image_data):
+    # Tiled results are cached apart from whole-image outputs, and the key
+    # covers the settings that change them
+    key = prediction_cache.key(f"tiled:{MAX_TILES}:{TILE_AGGREGATION}:{HEATMAP_SIZE}:".encode() + image_data)
+    cached = await cache_get(key)
+    if cached is not None:
+        return cached
+    return await single_flight(key, lambda: _score_tiled(key, image_data))
+
+async def _score_tiled(key, image_data):
+    loop = asyncio.get_running_loop()
+    with stage_seconds.time(stage="preprocess"):
+        tiles, boxes = await loop.run_in_executor(
+            preprocess_pool, functools.partial(preprocess_tiles, image_data, max_tiles=MAX_TILES)
+        )
+
+    # All tiles of an image go through the model as one batch, on the same
+    # inference thread the batcher uses
+    started = time.perf_counter()
+    outputs = await loop.run_in_executor(inference_pool, run_batch, tiles)
+    record_batch(len(tiles), [], time.perf_counter() - started)
+
+    result = aggregate_tiles(outputs, boxes)
+    prediction_cache.put(key, result)
+    return result
+
+def aggregate_tiles(outputs, boxes):
+    probabilities = torch.softmax(outputs.float(), 1)
+    if TILE_AGGREGATION == "mean":
+        image_probabilities = probabilities.mean(0)
+    else:
+        # A lesion that shows clearly in one tile is enough to flag its class
+        image_probabilities = probabilities.max(0).values
+    image_probabilities = image_probabilities / image_probabilities.sum()
+    predicted = image_probabilities.argmax().item()
+
+    # Each heatmap cell holds the highest score for the predicted class among
+    # the tiles covering it; the center crop only counts when nothing was tiled
+    centers = (torch.arange(HEATMAP_SIZE, dtype=torch.float32) + 0.5) / HEATMAP_SIZE
+    heatmap = torch.zeros(HEATMAP_SIZE, HEATMAP_SIZE)
+    scores = probabilities[:, predicted].tolist()
+    start = 1 if len(boxes) > 1 else 0
+    for (left, top, right, bottom), score in zip(boxes[start:], scores[start:]):
+        rows = (centers >= top) & (centers < bottom)
+        columns = (centers >= left) & (centers < right)
+        covered = rows[:, None] & columns[None, :]
+        heatmap = torch.where(covered, heatmap.clamp(min=score), heatmap)
+
+    return {
+        "probabilities": image_probabilities.tolist(),
+        "heatmap": [[round(value, 3) for value in row] for row in heatmap.tolist()],
+        "tiles": len(boxes),
+    }
+
+def format_prediction(outputs, top_k=0, guidance=False):
+    start = time.perf_counter()
+    probabilities = torch.softmax(outputs.float(), 0)
+    confidence, predicted = probabilities.max(0)
+    result = {
+        "predicted_disease": class_labels[predicted.item()],
+        "confidence": round(confidence.item(), 4),
+        "uncertain": confidence.item() < UNCERTAIN_THRESHOLD,
+    }
+    predictions_total.inc(predicted_class=result["predicted_disease"])
+    if top_k > 0:
+        values, indices = probabilities.topk(min(top_k, len(class_labels)))
+        result["top_k"] = [
+            {"label": class_labels[index], "probability": round(value, 4)}
+            for value, index in zip(values.tolist(), indices.tolist())
+        ]
+    if guidance:
+        result["guidance"] = guidance_index.get(result["predicted_disease"])
+        if guidance_index.stale:
+            result["guidance_stale"] = True
+    stage_seconds.observe(time.perf_counter() - start, stage="serialize")
+    return result
+
+def iter_archive(fileobj):
+    # Yields (name, bytes) one member at a time; tar archives are read as a
+    # stream so the whole archive is never held in memory
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield info.filename, archive.read(info)
+        return
+
+    fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield member.name, archive.extractfile(member).read()
+
+async def iter_batch_inputs(files, archive):
+    for file in files:
+        yield file.filename, await file.read()
+
+    if archive is not None:
+        loop = asyncio.get_running_loop()
+        members = iter_archive(archive.file)
+        while True:
+            item = await loop.run_in_executor(None, next, members, None)
+            if item is None:
+                break
+            yield item
+
+@app.on_event("startup")
+async def start_workers():
+    global preprocess_pool, inference_pool
+    if WORKER_POOL == "process":
+        # By now torch and the event loop have started threads, which a
+        # forked child would inherit mid-state; forkserver children start
+        # from a clean single-threaded process instead
+        preprocess_pool = ProcessPoolExecutor(
+            max_workers=WORKER_POOL_SIZE, mp_context=multiprocessing.get_context("forkserver")
+        )
+    else:
+        preprocess_pool = ThreadPoolExecutor(max_workers=WORKER_POOL_SIZE, thread_name_prefix="preprocess")
+    inference_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+    batcher.executor = inference_pool
+    batcher.start()
+    registry.start_flushing()
+    inference_pool.submit(prepare_model)
+
+@app.on_event("shutdown")
+async def stop_workers():
+    await batcher.stop()
+    # cancel_futures drops queued work instead of finishing it, but only
+    # exists from Python 3.9 and the Docker image runs 3.8
+    cancel = {"cancel_futures": True} if sys.version_info >= (3, 9) else {}
+    preprocess_pool.shutdown(wait=False, **cancel)
+    inference_pool.shutdown(wait=False, **cancel)
+    await asyncio.get_running_loop().run_in_executor(None, prediction_cache.flush)
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    if model_ready.is_set():
+        return {"status": "ready"}
+    if model_error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": model_error})
+    return JSONResponse(status_code=503, content={"status": "loading"})
+
+@app.get("/metrics")
+async def metrics():
+    # Aggregating across workers reads their snapshot files
+    text = await asyncio.get_running_loop().run_in_executor(None, registry.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/backend")
+async def backend_info():
+    return {
+        "backend": INFERENCE_BACKEND,
+        "parity": parity_report,
+        "cascade": {"arch": CASCADE_ARCH, "threshold": CASCADE_THRESHOLD, **cascade_stats} if cascade_model else None,
+    }
 
-    return {"predicted_disease": predicted_class}
+@app.post("/predict")
+async def predict(file: UploadFile = File(...), top_k: int = 0, guidance: bool = False, tiled: bool = False):
+    with admission():
+        # Read the image; decoding and inference happen off the event loop
+        with stage_seconds.time(stage="read"):
+            image_data = await file.read()
+        try:
+            if tiled:
+                tiled_result = await predict_tiled(image_data)
+                # format_prediction applies softmax, which maps log-probabilities
+                # back to the aggregated probabilities
+                outputs = torch.tensor(tiled_result["probabilities"]).clamp(min=1e-12).log()
+            else:
+                outputs = await predict_image(image_data)
+        except (UnidentifiedImageError, OSError) as e:
+            # Not an image PIL can read, or a truncated one
+            raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+
+    # Get the predicted class label, plus top-k probabilities if requested
+    result = format_prediction(outputs, top_k, guidance)
+    if tiled:
+        result["tiles"] = tiled_result["tiles"]
+        result["heatmap"] = tiled_result["heatmap"]
+    return result
     #return JSONResponse(content={"predicted_disease": predicted_class})
 
+@app.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    top_k: int = 0,
+    guidance: bool = False,
+):
+    if not files and archive is None:
+        raise HTTPException(status_code=400, detail="No files or archive uploaded")
+    acquire_slot()
+    released = False
+
+    def release():
+        # Called when the stream ends and again as a background task once
+        # the response is done, which also runs if the client disconnected
+        # before the stream was ever iterated; only the first call counts
+        nonlocal released
+        if not released:
+            released = True
+            release_slot()
+
+    async def score(index, name, image_data, results, limit):
+        try:
+            result = {"index": index, "filename": name, **format_prediction(await predict_image(image_data), top_k, guidance)}
+        except Exception as e:
+            result = {"index": index, "filename": name, "error": str(e)}
+        finally:
+            limit.release()
+        await results.put(result)
+
+    async def produce(results):
+        limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+        tasks = []
+        try:
+            index = 0
+            async for name, image_data in iter_batch_inputs(files or [], archive):
+                await limit.acquire()
+                tasks.append(asyncio.create_task(score(index, name, image_data, results, limit)))
+                index += 1
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            # Images read before the upload broke off are still scored and
+            # reported ahead of the error line
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await results.put({"error": f"Failed to read upload: {e}"})
+        finally:
+            # Tasks are only still running here when the client disconnected
+            for task in tasks:
+                task.cancel()
+            await results.put(None)
+
+    async def stream():
+        # Per-image results are written as NDJSON lines in completion order
+        results = asyncio.Queue()
+        producer = asyncio.create_task(produce(results))
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield json.dumps(result) + "\n"
+        finally:
+            producer.cancel()
+            release()
+
+    try:
+        return StreamingResponse(stream(), media_type="application/x-ndjson", background=BackgroundTask(release))
+    except Exception:
+        release()
+        raise
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="localhost", port=8001)
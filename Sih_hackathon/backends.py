@@ -0,0 +1,123 @@
+import copy
+import os
+
+import torch
+
+BACKENDS = ("eager", "dynamic_int8", "static_int8", "torchscript", "compile", "onnx")
+CPU_ONLY_BACKENDS = ("dynamic_int8", "static_int8", "onnx")
+
+
+def build_backend(name, model, device, calibration_batches=None, onnx_path=None, num_threads=None):
+    """Returns a callable mapping a (N, 3, 224, 224) batch to (N, num_classes)
+    logits, built from the fp32 model according to the backend name."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}, expected one of {BACKENDS}")
+    if name in CPU_ONLY_BACKENDS and device.type != "cpu":
+        raise ValueError(f"Inference backend {name!r} only runs on CPU")
+
+    example = torch.randn(1, 3, 224, 224, device=device)
+
+    if name == "eager":
+        return model
+
+    if name == "dynamic_int8":
+        # Only nn.Linear is dynamically quantizable, so for ResNet this
+        # covers the classifier head; convolutions stay fp32
+        return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {torch.nn.Linear}, dtype=torch.qint8)
+
+    if name == "static_int8":
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        if not calibration_batches:
+            print("Warning: calibrating static int8 on random inputs, set CALIBRATION_DIR for real images")
+            calibration_batches = [torch.randn(8, 3, 224, 224) for _ in range(4)]
+        prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping("x86"), example_inputs=(example,))
+        with torch.no_grad():
+            for batch in calibration_batches:
+                prepared(batch)
+        return convert_fx(prepared)
+
+    if name == "torchscript":
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+    if name == "compile":
+        return torch.compile(model, dynamic=True)
+
+    return build_onnx_backend(model, onnx_path, num_threads)
+
+
+def export_onnx(model, onnx_path):
+    print(f"Exporting model to {onnx_path}")
+    # Written under a per-process name and moved into place, so other
+    # processes never open a half-written graph
+    tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+    torch.onnx.export(
+        model,
+        torch.randn(1, 3, 224, 224),
+        tmp_path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17,
+    )
+    os.replace(tmp_path, onnx_path)
+
+
+def build_onnx_backend(model, onnx_path, num_threads=None):
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        raise RuntimeError("The onnx backend needs onnxruntime, install it with `pip install onnxruntime`")
+
+    if not os.path.exists(onnx_path):
+        export_onnx(model, onnx_path)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def run(batch):
+        return torch.from_numpy(session.run(None, {"input": batch.cpu().numpy()})[0])
+
+    return run
+
+
+def load_sample_batches(directory, preprocess, batch_size=16, limit=256):
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory)
+        for name in names
+        if name.lower().endswith((".jpg", ".jpeg", ".png"))
+    )[:limit]
+    batches = []
+    for start in range(0, len(paths), batch_size):
+        tensors = []
+        for path in paths[start:start + batch_size]:
+            with open(path, "rb") as f:
+                tensors.append(preprocess(f.read()))
+        batches.append(torch.stack(tensors))
+    return batches
+
+
+def check_parity(reference, candidate, batches, device):
+    """Top-1 agreement and max logit difference of candidate vs reference."""
+    samples = agree = 0
+    max_abs_diff = 0.0
+    with torch.no_grad():
+        for batch in batches:
+            batch = batch.to(device)
+            expected = reference(batch).float().cpu()
+            actual = candidate(batch).float().cpu()
+            agree += (expected.argmax(1) == actual.argmax(1)).sum().item()
+            samples += batch.shape[0]
+            max_abs_diff = max(max_abs_diff, (expected - actual).abs().max().item())
+    return {
+        "samples": samples,
+        "top1_agreement": agree / samples if samples else None,
+        "max_abs_logit_diff": max_abs_diff,
+    }
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import deque
+
+import torch
+
+
+class MicroBatcher:
+    """Collects single-image tensors from concurrent requests and runs them
+    through the model as one batch, handing each caller back its own row."""
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=5.0, executor=None, on_batch=None):
+        self.run_batch = run_batch
+        # Optional on_batch(batch_size, queue_wait_seconds, run_seconds) hook
+        self.on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self._pending = deque()
+        self._buffer = None
+        self._wakeup = None
+        self._task = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    async def submit(self, tensor):
+        if self._task is None:
+            raise RuntimeError("Batcher not started")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((tensor, future, time.perf_counter()))
+        self._wakeup.set()
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        await self._wakeup.wait()
+
+        # Give concurrent requests a short window to join the batch
+        deadline = loop.time() + self.max_wait
+        while len(self._pending) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+        items = []
+        while self._pending and len(items) < self.max_batch_size:
+            item = self._pending.popleft()
+            if not item[1].cancelled():
+                items.append(item)
+        if self._pending:
+            self._wakeup.set()
+        else:
+            self._wakeup.clear()
+        return items
+
+    def _stack(self, tensors):
+        # Batches run one at a time, so a single input buffer is reused
+        shape = tensors[0].shape
+        if self._buffer is None or self._buffer.shape[1:] != shape or self._buffer.dtype != tensors[0].dtype:
+            self._buffer = torch.empty((self.max_batch_size, *shape), dtype=tensors[0].dtype)
+        return torch.stack(tensors, out=self._buffer[:len(tensors)])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            if not items:
+                continue
+
+            batch = self._stack([tensor for tensor, _, _ in items])
+            started = time.perf_counter()
+            try:
+                outputs = await loop.run_in_executor(self.executor, self.run_batch, batch)
+            except Exception as exc:
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            if self.on_batch is not None:
+                self.on_batch(len(items), [started - enqueued for _, _, enqueued in items], time.perf_counter() - started)
+            for (_, future, _), row in zip(items, outputs):
+                if not future.done():
+                    future.set_result(row)
@@ -0,0 +1,274 @@
+"""Benchmarks for the prediction service, using synthetic images and
+printing JSON so results can be diffed across commits.
+
+    python benchmark.py micro                       # preprocessing vs forward pass
+    python benchmark.py inprocess --concurrency 16  # full pipeline, no HTTP
+    python benchmark.py http --url http://localhost:8001/predict --rate 20
+"""
+import argparse
+import asyncio
+import http.client
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+from PIL import Image
+
+
+def parse_sizes(spec):
+    # "640x480:1,4000x3000:2" -> [((640, 480), 1.0), ((4000, 3000), 2.0)]
+    sizes = []
+    for part in spec.split(","):
+        size, _, weight = part.partition(":")
+        width, height = (int(value) for value in size.lower().split("x"))
+        sizes.append(((width, height), float(weight or 1)))
+    return sizes
+
+
+def synthetic_jpeg(width, height, rng):
+    # Upsampled low-resolution noise compresses like a photo, unlike raw noise
+    small = rng.integers(0, 256, size=(max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_images(sizes, count, seed):
+    rng = np.random.default_rng(seed)
+    picker = random.Random(seed)
+    dimensions = [size for size, _ in sizes]
+    weights = [weight for _, weight in sizes]
+    return [synthetic_jpeg(*picker.choices(dimensions, weights)[0], rng) for _ in range(count)]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, wall_seconds):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "images_per_second": len(latencies) / wall_seconds if wall_seconds else None,
+        "latency_ms": {
+            "mean": 1000 * sum(latencies) / len(latencies) if latencies else None,
+            "p50": 1000 * percentile(latencies, 0.50) if latencies else None,
+            "p95": 1000 * percentile(latencies, 0.95) if latencies else None,
+            "p99": 1000 * percentile(latencies, 0.99) if latencies else None,
+        },
+        "wall_seconds": wall_seconds,
+    }
+
+
+def peak_rss_mb(pid=None):
+    if pid is None:
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return {"p50_ms": 1000 * percentile(durations, 0.5), "min_ms": 1000 * durations[0]}
+
+
+def bench_micro(args, images):
+    import torch
+
+    import app as service
+    from preprocessing import preprocess
+
+    def reference(data):
+        return service.transform(Image.open(io.BytesIO(data)).convert("RGB"))
+
+    results = {"preprocess": {}, "forward": {}}
+    for name, fn in (("fast", preprocess), ("torchvision", reference)):
+        results["preprocess"][name] = timed(lambda: [fn(data) for data in images], args.repeat)
+        results["preprocess"][name]["per_image_ms"] = results["preprocess"][name]["p50_ms"] / len(images)
+
+    service.load_model()
+    for batch_size in args.batch_sizes:
+        batch = torch.randn(batch_size, 3, 224, 224)
+        service.run_batch(batch)
+        stats = timed(lambda: service.run_batch(batch), args.repeat)
+        stats["per_image_ms"] = stats["p50_ms"] / batch_size
+        results["forward"][str(batch_size)] = stats
+    return results
+
+
+async def drive(request, images, concurrency, rate, total):
+    # Closed loop with `concurrency` callers, or open loop at `rate` req/s
+    # capped at `concurrency` outstanding requests
+    latencies = []
+    errors = 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        nonlocal errors
+        try:
+            start = time.perf_counter()
+            await request(images[index % len(images)])
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors += 1
+        finally:
+            limit.release()
+
+    tasks = []
+    start = time.perf_counter()
+    for index in range(total):
+        if rate:
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await limit.acquire()
+        tasks.append(asyncio.create_task(one(index)))
+    await asyncio.gather(*tasks)
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def bench_inprocess(args, images):
+    import app as service
+    from cache import PredictionCache
+
+    if not args.cache:
+        service.prediction_cache = PredictionCache(max_entries=0)
+    # Runs the app's startup and shutdown handlers the way a server would
+    async with service.app.router.lifespan_context(service.app):
+        while not service.model_ready.is_set():
+            if service.model_error:
+                raise RuntimeError(service.model_error)
+            await asyncio.sleep(0.1)
+
+        async def request(data):
+            if args.cache:
+                outputs = await service.predict_image(data)
+            else:
+                # Skip the merging of identical in-flight requests as well,
+                # so repeated images still cost one forward pass each
+                outputs = await service._score_uncached(service.prediction_cache.key(data), data)
+            service.format_prediction(outputs)
+
+        await drive(request, images, args.concurrency, None, min(args.warmup, args.requests))
+        return await drive(request, images, args.concurrency, args.rate, args.requests)
+
+
+def http_request(url):
+    parsed = urlparse(url)
+    local = threading.local()
+
+    def send(data):
+        if not hasattr(local, "connection"):
+            local.connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=60)
+        boundary = uuid.uuid4().hex
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"image.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n"
+        ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        try:
+            local.connection.request(
+                "POST", parsed.path or "/predict", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+            )
+            response = local.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            del local.connection
+            raise
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+
+    return send
+
+
+async def bench_http(args, images):
+    send = http_request(args.url)
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def request(data):
+        await loop.run_in_executor(executor, send, data)
+
+    try:
+        await drive(request, images, args.concurrency, None, min(args.warmup, args.requests))
+        results = await drive(request, images, args.concurrency, args.rate, args.requests)
+    finally:
+        executor.shutdown()
+    if args.server_pid:
+        results["server_peak_rss_mb"] = peak_rss_mb(args.server_pid)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the plant disease prediction service")
+    parser.add_argument("mode", choices=["micro", "inprocess", "http"])
+    parser.add_argument("--sizes", default="640x480:1,1600x1200:1,4000x3000:1", help="WxH[:weight],...")
+    parser.add_argument("--num-images", type=int, default=32, help="distinct synthetic images")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=None, help="requests per second (default: closed loop)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=16)
+    parser.add_argument("--cache", action="store_true", help="keep the prediction cache enabled in-process")
+    parser.add_argument("--url", default="http://localhost:8001/predict")
+    parser.add_argument("--server-pid", type=int, default=None, help="report this process's peak RSS too")
+    parser.add_argument("--batch-sizes", type=lambda s: [int(v) for v in s.split(",")], default=[1, 4, 16])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    images = make_images(parse_sizes(args.sizes), args.num_images, args.seed)
+    if args.mode == "micro":
+        results = bench_micro(args, images)
+    elif args.mode == "inprocess":
+        results = asyncio.run(bench_inprocess(args, images))
+    else:
+        results = asyncio.run(bench_http(args, images))
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    report = {
+        "mode": args.mode,
+        "commit": git_commit(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """LRU cache of model outputs keyed by a content hash, with an optional
+    TTL and an optional SQLite tier on disk that survives restarts."""
+
+    def __init__(self, max_entries=10000, ttl_seconds=None, disk_path=None, max_disk_entries=100000, namespace=""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.namespace = namespace.encode()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_writes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk_path = disk_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._writes = None
+        self._pid = None
+
+    def _start(self):
+        # The connection and its writer thread are created on first use in
+        # each process: a SQLite connection must not be carried across
+        # fork(), and serve.py forks after importing app
+        if self._pid == os.getpid():
+            return
+        with self._db_lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+            )
+            self._db.commit()
+            self._writes = queue.Queue()
+            threading.Thread(target=self._write_loop, name="prediction-cache-writer", daemon=True).start()
+            self._pid = os.getpid()
+
+    def key(self, data):
+        return hashlib.sha256(self.namespace + data).hexdigest()
+
+    def _expired(self, created):
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def get(self, key):
+        value = self.get_memory(key)
+        if value is None and self.disk_path:
+            return self.get_disk(key)
+        return value
+
+    def get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            if not self.disk_path:
+                self.misses += 1
+            return None
+
+    def get_disk(self, key):
+        # Blocks on SQLite, so async callers run it in an executor
+        self._start()
+        with self._db_lock:
+            row = self._db.execute("SELECT value, created FROM predictions WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is not None and not self._expired(row[1]):
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                self.disk_hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, value)
+        if self.disk_path:
+            # Disk writes are batched by the writer thread; until then the
+            # entry is served from memory
+            self._start()
+            self._writes.put((key, json.dumps(value), created))
+
+    def flush(self):
+        # Waits until queued disk writes are committed
+        if self._pid == os.getpid():
+            self._writes.join()
+
+    def _write_loop(self):
+        while True:
+            rows = [self._writes.get()]
+            while len(rows) < 500:
+                try:
+                    rows.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._db_lock:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO predictions (key, value, created) VALUES (?, ?, ?)", rows
+                    )
+                    previous, self._disk_writes = self._disk_writes, self._disk_writes + len(rows)
+                    if previous // 1000 != self._disk_writes // 1000:
+                        # Trim the disk tier to the newest max_disk_entries rows
+                        self._db.execute(
+                            "DELETE FROM predictions WHERE key IN (SELECT key FROM predictions "
+                            "ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                            (self.max_disk_entries,),
+                        )
+                    self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Prediction cache write failed: {e!r}")
+            finally:
+                for _ in rows:
+                    self._writes.task_done()
+
+    def _remember(self, key, created, value):
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
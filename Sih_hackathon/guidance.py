@@ -0,0 +1,154 @@
+"""Precomputed treatment guidance for each predicted class.
+
+Retrieval runs once per class (its label plus the fields of DISEASE_INFO in
+web.py) and the ranked passages are stored in a small JSON index that the
+prediction API reads with a dict lookup. The index records a fingerprint
+of the collection and is rebuilt when that changes. A non-dry-run
+injest.py that changes the collection marks the index stale, and the API
+flags guidance it serves from a stale index until it is rebuilt:
+
+    python guidance.py build                # rebuild if the collection changed
+    python guidance.py build --watch 300    # keep checking every 5 minutes
+"""
+import argparse
+import ast
+import json
+import os
+import threading
+import time
+
+GUIDANCE_FIELDS = ("symptoms", "cause", "prevention", "recommended_action")
+
+
+def load_disease_info(web_path):
+    # Read the DISEASE_INFO literal from web.py without importing streamlit
+    with open(web_path) as f:
+        tree = ast.parse(f.read(), filename=web_path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == "DISEASE_INFO" for target in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"No DISEASE_INFO in {web_path}")
+
+
+def class_queries(label, info):
+    queries = [label]
+    queries.extend(f"{label} {info[field]}" for field in GUIDANCE_FIELDS if info.get(field))
+    return queries
+
+
+def retrieve_for_class(search, label, info, per_query, limit):
+    # Merge the hits of every query, keeping each passage's best score
+    best = {}
+    for query in class_queries(label, info):
+        for hit in search(query, per_query):
+            if hit["text"] not in best or hit["score"] > best[hit["text"]]["score"]:
+                best[hit["text"]] = hit
+    return sorted(best.values(), key=lambda hit: hit["score"], reverse=True)[:limit]
+
+
+def build_index(labels, disease_info, fingerprint, per_query=5, limit=5):
+    import retrieval
+
+    classes = {
+        label: retrieve_for_class(retrieval.search, label, disease_info.get(label, {}), per_query, limit)
+        for label in labels
+    }
+    return {
+        "fingerprint": fingerprint,
+        "collection": retrieval.COLLECTION_NAME,
+        "model": retrieval.EMBEDDING_MODEL,
+        "built_at": time.time(),
+        "classes": classes,
+    }
+
+
+def save_index(path, index):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+def stored_fingerprint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get("fingerprint")
+
+
+class GuidanceIndex:
+    """Serves precomputed passages by class label, reloading the file at most
+    every reload_seconds when it has been rewritten. stale is set once
+    injest.py has changed the collection the index was built from."""
+
+    def __init__(self, path, reload_seconds=30):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._classes = {}
+        self._stale = False
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.reload_seconds and self._mtime is not None:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                return
+            if mtime != self._mtime:
+                with open(self.path) as f:
+                    index = json.load(f)
+                self._classes = index["classes"]
+                self._stale = index.get("stale", False)
+                self._mtime = mtime
+
+    def get(self, label):
+        self._maybe_reload()
+        return self._classes.get(label, [])
+
+    @property
+    def stale(self):
+        self._maybe_reload()
+        return self._stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute retrieval results per disease class")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build")
+    build.add_argument("--output", default=os.environ.get("GUIDANCE_INDEX", "guidance_index.json"))
+    build.add_argument("--web", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "web.py"))
+    build.add_argument("--per-query", type=int, default=5, help="hits retrieved per query")
+    build.add_argument("--limit", type=int, default=5, help="passages kept per class")
+    build.add_argument("--force", action="store_true", help="rebuild even if the collection is unchanged")
+    build.add_argument("--watch", type=float, default=None, help="re-check the collection every N seconds")
+    args = parser.parse_args()
+
+    import retrieval
+    from app import class_labels
+
+    disease_info = load_disease_info(args.web)
+    force = args.force
+    while True:
+        fingerprint = retrieval.get_index().fingerprint()
+        if force or stored_fingerprint(args.output) != fingerprint:
+            index = build_index(class_labels, disease_info, fingerprint, args.per_query, args.limit)
+            save_index(args.output, index)
+            print(f"Wrote guidance for {len(class_labels)} classes to {args.output}")
+        else:
+            print("Guidance index is up to date")
+        if args.watch is None:
+            break
+        force = False
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value not in (float("inf"), float("-inf")) else ("+Inf" if value > 0 else "-Inf")
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def render(self, state=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples(self.state() if state is None else state))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def state(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+    def _samples(self, state):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in state.items()]
+
+
+class Gauge(Metric):
+    """A gauge read from a callback at scrape time; kind="counter" exposes a
+    monotonic value owned by some other object (e.g. cache hit counts)."""
+
+    def __init__(self, name, help, fn, kind="gauge"):
+        super().__init__(name, help)
+        self.fn = fn
+        self.kind = kind
+
+    def state(self):
+        return self.fn()
+
+    def _samples(self, state):
+        return [f"{self.name} {_format_value(state)}"]
+
+    def render_workers(self, values):
+        # One series per worker process, as summing e.g. ratios is meaningless
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(
+            f"{self.name}{_format_labels((('worker', pid),))} {_format_value(value)}"
+            for pid, value in sorted(values.items())
+        )
+        return "\n".join(lines)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def state(self):
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    @staticmethod
+    def merge(value, other):
+        return [a + b for a, b in zip(value[0], other[0])], value[1] + other[1]
+
+    def _samples(self, state):
+        lines = []
+        for key, (counts, total) in state.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = key + (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """Renders its metrics in Prometheus text format. With multiprocess_dir
+    set, every process writes a snapshot of its metrics there (on each
+    scrape and every flush_seconds), and a scrape of any process renders
+    counters and histograms summed over all snapshots, including those of
+    exited processes, and gauges per live process with a worker label."""
+
+    def __init__(self, multiprocess_dir=None, flush_seconds=1.0):
+        self._metrics = []
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_seconds = flush_seconds
+        self._flusher_pid = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        if not self.multiprocess_dir:
+            return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+        self.write_snapshot()
+        snapshots = self._read_snapshots()
+        blocks = []
+        for metric in self._metrics:
+            if isinstance(metric, Gauge):
+                blocks.append(metric.render_workers({
+                    pid: snapshot[metric.name]
+                    for pid, snapshot in snapshots.items()
+                    if metric.name in snapshot and _alive(pid)
+                }))
+                continue
+            merged = {}
+            for snapshot in snapshots.values():
+                for key, value in snapshot.get(metric.name, []):
+                    key = tuple(tuple(pair) for pair in key)
+                    merged[key] = metric.merge(merged[key], value) if key in merged else value
+            blocks.append(metric.render(merged))
+        return "\n".join(blocks) + "\n"
+
+    def write_snapshot(self):
+        snapshot = {}
+        for metric in self._metrics:
+            state = metric.state()
+            snapshot[metric.name] = state if isinstance(metric, Gauge) else [[key, value] for key, value in state.items()]
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    def _read_snapshots(self):
+        snapshots = {}
+        for name in os.listdir(self.multiprocess_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, name)) as f:
+                    snapshots[int(name[:-len(".json")])] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def start_flushing(self):
+        # Keeps this process's snapshot fresh for scrapes served by others
+        if not self.multiprocess_dir or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def flush():
+            while True:
+                time.sleep(self.flush_seconds)
+                try:
+                    self.write_snapshot()
+                except OSError as e:
+                    print(f"Writing metrics snapshot failed: {e!r}")
+
+        threading.Thread(target=flush, name="metrics-flush", daemon=True).start()
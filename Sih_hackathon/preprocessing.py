@@ -0,0 +1,192 @@
+import io
+import math
+import os
+import sys
+
+import numpy as np
+import torch
+from PIL import Image
+
+RESIZE_SIZE = 256
+CROP_SIZE = 224
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# (x / 255 - mean) / std == x * SCALE - OFFSET, per channel
+SCALE = (1.0 / (255.0 * STD)).reshape(3, 1, 1)
+OFFSET = (MEAN / STD).reshape(3, 1, 1)
+
+# Agreement with the torchvision Resize/CenterCrop/ToTensor/Normalize chain,
+# in normalized units (one uint8 level is ~0.017). Non-JPEG inputs only differ
+# by float rounding; JPEGs decoded in draft mode differ by a few levels along
+# sharp edges because libjpeg downscales in the DCT domain.
+MEAN_ABS_TOLERANCE = 0.02
+MAX_ABS_TOLERANCE = 0.35
+
+# Tiled inference: short side of each pyramid level, and the fraction by which
+# neighbouring tiles overlap (reduced when a level would exceed the tile cap).
+# With these levels a 4:3 photo is covered by 1 + 6 + 20 tiles, so the fine
+# level, where each tile spans a third of the short side, fits within the
+# default cap of 32 for common aspect ratios
+TILE_LEVELS = (336, 672)
+TILE_OVERLAP = 0.25
+
+
+def decode_image(image_data, resize_size=RESIZE_SIZE):
+    # Twice the resize target keeps the final resize antialiased
+    return load_rgb(Image.open(io.BytesIO(image_data)), 2 * resize_size)
+
+
+def load_rgb(image, min_short_side):
+    if image.format == "JPEG":
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale as long as the short
+        # side stays at least min_short_side
+        width, height = image.size
+        scale = min_short_side / min(width, height)
+        if scale < 1:
+            image.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+    return image.convert("RGB")
+
+
+def crop_box(width, height, resize_size=RESIZE_SIZE, crop_size=CROP_SIZE):
+    # Same geometry as Resize(resize_size) followed by CenterCrop(crop_size),
+    # expressed in source pixel coordinates
+    if width <= height:
+        resized_width, resized_height = resize_size, int(resize_size * height / width)
+    else:
+        resized_width, resized_height = int(resize_size * width / height), resize_size
+    top = int(round((resized_height - crop_size) / 2.0))
+    left = int(round((resized_width - crop_size) / 2.0))
+    scale_x = width / resized_width
+    scale_y = height / resized_height
+    return (
+        left * scale_x,
+        top * scale_y,
+        (left + crop_size) * scale_x,
+        (top + crop_size) * scale_y,
+    )
+
+
+def preprocess_into(image, out, crop_size=CROP_SIZE):
+    """Resizes, crops and normalizes a PIL image into `out`, a float32
+    (3, crop_size, crop_size) tensor, without intermediate float images."""
+    cropped = image.resize((crop_size, crop_size), Image.BILINEAR, box=crop_box(*image.size, crop_size=crop_size))
+    return normalize_into(cropped, out)
+
+
+def normalize_into(image, out):
+    pixels = np.asarray(image).transpose(2, 0, 1)
+    target = out.numpy()
+    np.multiply(pixels, SCALE, out=target)
+    np.subtract(target, OFFSET, out=target)
+    return out
+
+
+def preprocess(image_data):
+    out = torch.empty(3, CROP_SIZE, CROP_SIZE, dtype=torch.float32)
+    return preprocess_into(decode_image(image_data), out)
+
+
+def preprocess_batch(images_data, out=None):
+    # `out` may be a preallocated (N, 3, 224, 224) buffer reused across batches
+    if out is None:
+        out = torch.empty(len(images_data), 3, CROP_SIZE, CROP_SIZE, dtype=torch.float32)
+    for index, image_data in enumerate(images_data):
+        preprocess_into(decode_image(image_data), out[index])
+    return out[:len(images_data)]
+
+
+def tile_offsets(length, tile_size, overlap):
+    # Evenly spaced offsets covering [0, length) with at least `overlap`
+    if length <= tile_size:
+        return [0]
+    count = math.ceil((length - tile_size) / (tile_size * (1 - overlap))) + 1
+    step = (length - tile_size) / (count - 1)
+    return [round(index * step) for index in range(count)]
+
+
+def plan_tiles(width, height, levels=TILE_LEVELS, max_tiles=32, overlap=TILE_OVERLAP, tile_size=CROP_SIZE):
+    """Returns [(level, level_width, level_height, xs, ys)], coarse to fine,
+    for an image of the given size, counting the center crop as one tile.
+    A level that would exceed max_tiles falls back to half the overlap, then
+    to none; levels that still don't fit, or that are above the source
+    resolution, are skipped."""
+    short_side = min(width, height)
+    plan = []
+    total = 1
+    for level in sorted(levels):
+        if level > short_side:
+            break
+        level_width = max(tile_size, round(width * level / short_side))
+        level_height = max(tile_size, round(height * level / short_side))
+        for level_overlap in (overlap, overlap / 2, 0.0):
+            xs = tile_offsets(level_width, tile_size, level_overlap)
+            ys = tile_offsets(level_height, tile_size, level_overlap)
+            if total + len(xs) * len(ys) <= max_tiles:
+                plan.append((level, level_width, level_height, xs, ys))
+                total += len(xs) * len(ys)
+                break
+    return plan
+
+
+def preprocess_tiles(image_data, levels=TILE_LEVELS, max_tiles=32, overlap=TILE_OVERLAP, tile_size=CROP_SIZE):
+    """Returns (tiles, boxes): the standard center crop followed by the
+    tiles of plan_tiles, as a float32 (N, 3, tile_size, tile_size) tensor,
+    and each tile's (left, top, right, bottom) box as fractions of the
+    image."""
+    image = Image.open(io.BytesIO(image_data))
+    plan = plan_tiles(*image.size, levels=levels, max_tiles=max_tiles, overlap=overlap, tile_size=tile_size)
+    # Decode only as large as the finest planned level (or the center crop)
+    # needs
+    image = load_rgb(image, max([level for level, *_ in plan] + [2 * RESIZE_SIZE]))
+    width, height = image.size
+
+    total = 1 + sum(len(xs) * len(ys) for _, _, _, xs, ys in plan)
+    tiles = torch.empty(total, 3, tile_size, tile_size, dtype=torch.float32)
+    left, top, right, bottom = crop_box(width, height, crop_size=tile_size)
+    boxes = [(left / width, top / height, right / width, bottom / height)]
+    preprocess_into(image, tiles[0], crop_size=tile_size)
+
+    index = 1
+    for _, level_width, level_height, xs, ys in plan:
+        level_image = image.resize((level_width, level_height), Image.BILINEAR)
+        for y in ys:
+            for x in xs:
+                normalize_into(level_image.crop((x, y, x + tile_size, y + tile_size)), tiles[index])
+                boxes.append((
+                    x / level_width,
+                    y / level_height,
+                    (x + tile_size) / level_width,
+                    (y + tile_size) / level_height,
+                ))
+                index += 1
+    return tiles, boxes
+
+
+def compare_with_reference(image_data, reference_transform):
+    expected = reference_transform(Image.open(io.BytesIO(image_data)).convert("RGB"))
+    diff = (preprocess(image_data) - expected).abs()
+    return {"mean_abs_diff": diff.mean().item(), "max_abs_diff": diff.max().item()}
+
+
+if __name__ == "__main__":
+    # python preprocessing.py <image dir>: check agreement with the torchvision chain
+    import torchvision.transforms as transforms
+
+    reference = transforms.Compose([
+        transforms.Resize(RESIZE_SIZE),
+        transforms.CenterCrop(CROP_SIZE),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=MEAN.tolist(), std=STD.tolist()),
+    ])
+    failures = 0
+    for root, _, names in os.walk(sys.argv[1]):
+        for name in sorted(names):
+            if not name.lower().endswith((".jpg", ".jpeg", ".png")):
+                continue
+            with open(os.path.join(root, name), "rb") as f:
+                result = compare_with_reference(f.read(), reference)
+            ok = result["mean_abs_diff"] <= MEAN_ABS_TOLERANCE and result["max_abs_diff"] <= MAX_ABS_TOLERANCE
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name}: {result}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,183 @@
+"""Retrieval API over the crop_vector_db collection built by vector db/injest.py.
+
+    python retrieval.py serve                        # http://localhost:8002/search?q=...
+    python retrieval.py export --output index.npz    # snapshot Qdrant to a flat file
+    RETRIEVAL_BACKEND=flat python retrieval.py serve # serve the snapshot, no Qdrant needed
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from fastapi import FastAPI, HTTPException
+
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "NeuML/pubmedbert-base-embeddings")
+COLLECTION_NAME = os.environ.get("COLLECTION_NAME", "crop_vector_db")
+QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
+QDRANT_PREFER_GRPC = os.environ.get("QDRANT_PREFER_GRPC", "0") == "1"
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "qdrant")  # "qdrant" or "flat"
+FLAT_INDEX_PATH = os.environ.get("FLAT_INDEX_PATH", "crop_vector_db.npz")
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "1024"))
+MAX_TOP_K = 50
+
+app = FastAPI(title="Crop Guidance Retrieval API")
+
+
+class FlatIndex:
+    """Exact cosine search over vectors held in memory, saved as an .npz file."""
+
+    def __init__(self, vectors, payloads):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.clip(norms, 1e-12, None)
+        self.payloads = payloads
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["vectors"], [json.loads(payload) for payload in data["payloads"]])
+
+    def save(self, path):
+        np.savez(path, vectors=self.vectors, payloads=np.array([json.dumps(p) for p in self.payloads]))
+
+    def search(self, vector, k):
+        if not len(self.payloads):
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        scores = self.vectors @ (query / max(np.linalg.norm(query), 1e-12))
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.payloads[i]) for i in top]
+
+    def fingerprint(self):
+        digest = hashlib.sha256(self.vectors.tobytes())
+        digest.update(json.dumps(self.payloads, sort_keys=True).encode())
+        return digest.hexdigest()
+
+
+class QdrantIndex:
+    def __init__(self, url, collection, prefer_grpc=False):
+        from qdrant_client import QdrantClient
+
+        # One client per process: it keeps a pooled keep-alive HTTP (or gRPC)
+        # connection that all requests share
+        self.client = QdrantClient(url=url, prefer_grpc=prefer_grpc, timeout=10)
+        self.collection = collection
+
+    def search(self, vector, k):
+        hits = self.client.search(self.collection, query_vector=list(vector), limit=k, with_payload=True)
+        return [(hit.score, hit.payload) for hit in hits]
+
+    def fingerprint(self):
+        # Ingestion derives point ids from file content hashes, so the id set
+        # changes whenever any document is added, changed or removed
+        ids = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                self.collection, limit=10000, offset=offset, with_payload=False, with_vectors=False
+            )
+            ids.extend(str(point.id) for point in points)
+            if offset is None:
+                return hashlib.sha256("\n".join(sorted(ids)).encode()).hexdigest()
+
+    def export_flat(self):
+        vectors, payloads = [], []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                self.collection, limit=1000, offset=offset, with_payload=True, with_vectors=True
+            )
+            for point in points:
+                vectors.append(point.vector)
+                payloads.append(point.payload)
+            if offset is None:
+                return FlatIndex(vectors, payloads)
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+_index = None
+
+
+def get_encoder():
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            from sentence_transformers import SentenceTransformer
+
+            _encoder = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    return _encoder
+
+
+def get_index():
+    global _index
+    if _index is None:
+        if RETRIEVAL_BACKEND == "flat":
+            _index = FlatIndex.load(FLAT_INDEX_PATH)
+        else:
+            _index = QdrantIndex(QDRANT_URL, COLLECTION_NAME, QDRANT_PREFER_GRPC)
+    return _index
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def embed_query(query):
+    return tuple(get_encoder().encode(query, convert_to_numpy=True).tolist())
+
+
+def search(query, k=5):
+    # The embedding model is uncased, so normalising case and whitespace lets
+    # trivially different queries share a cache entry
+    query = " ".join(query.split()).lower()
+    hits = get_index().search(embed_query(query), k)
+    return [
+        {"score": score, "text": payload.get("page_content"), "metadata": payload.get("metadata", {})}
+        for score, payload in hits
+    ]
+
+
+@app.on_event("startup")
+def warm_up():
+    get_index()
+    embed_query("warm up")
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/search")
+def search_endpoint(q: str, k: int = 5):
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Empty query")
+    results = search(q, max(1, min(k, MAX_TOP_K)))
+    return {"query": q, "results": results, "query_cache": embed_query.cache_info()._asdict()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crop guidance retrieval service")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve")
+    serve.add_argument("--host", default="localhost")
+    serve.add_argument("--port", type=int, default=8002)
+    export = subparsers.add_parser("export", help="snapshot the Qdrant collection into a flat index file")
+    export.add_argument("--output", default=FLAT_INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        index = QdrantIndex(QDRANT_URL, COLLECTION_NAME, QDRANT_PREFER_GRPC).export_flat()
+        index.save(args.output)
+        print(f"Wrote {len(index.payloads)} vectors to {args.output}")
+    else:
+        import uvicorn
+
+        uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Offline bulk scoring of image directories and tar shards, without HTTP.
+
+Inputs are split into shards (each tar file, or --shard-size files of a
+directory) that DataLoader workers decode and preprocess in parallel while
+the main process runs large batches through the model. Each finished shard is
+written as a part file next to the output, so an interrupted job picks up
+where it stopped; once every shard is done the parts are merged:
+
+    python score.py /data/survey-2023 shards/*.tar --output predictions.csv
+    python score.py /data/survey-2023 --output predictions.parquet  # needs pyarrow
+"""
+import argparse
+import collections
+import csv
+import hashlib
+import os
+import tarfile
+import time
+
+import torch
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+import app as service
+
+Shard = collections.namedtuple("Shard", "id kind path files")
+
+
+def parse_args():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Score archived images with the plant disease model")
+    parser.add_argument("inputs", nargs="+", help="image directories and/or tar shards")
+    parser.add_argument("--output", required=True, help="a .csv or .parquet file")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=max(1, cores // 2), help="decode/preprocess processes")
+    parser.add_argument("--prefetch", type=int, default=4, help="batches prefetched per worker")
+    parser.add_argument(
+        "--threads", type=int, default=None, help="torch threads for the forward pass, defaults to the remaining cores"
+    )
+    parser.add_argument("--shard-size", type=int, default=1000, help="directory files per shard")
+    parser.add_argument("--probabilities", action="store_true", help="add one probability column per class")
+    return parser.parse_args()
+
+
+def output_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in (".csv", ".parquet"):
+        raise SystemExit(f"Unsupported output format {extension!r}, use .csv or .parquet")
+    return extension[1:]
+
+
+def settings_key(args):
+    # Part files are only reused when they were scored with the same model
+    return f"{service.MODEL_PATH}:{service.INFERENCE_BACKEND}:{service.CASCADE_MODEL_PATH}:{args.probabilities}"
+
+
+def shard_id(*parts):
+    return hashlib.sha256("\n".join(str(part) for part in parts).encode()).hexdigest()[:20]
+
+
+def plan_shards(inputs, shard_size, settings):
+    shards = []
+    for path in inputs:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in names
+                if name.lower().endswith(service.IMAGE_EXTENSIONS)
+            )
+            for start in range(0, len(files), shard_size):
+                chunk = tuple(files[start:start + shard_size])
+                shards.append(Shard(shard_id(settings, *chunk), "dir", path, chunk))
+        else:
+            stat = os.stat(path)
+            shards.append(Shard(shard_id(settings, path, stat.st_size, stat.st_mtime), "tar", path, None))
+    return shards
+
+
+def read_shard(shard):
+    if shard.kind == "tar":
+        # Read as a stream, so shards never have to fit in memory
+        with tarfile.open(shard.path, mode="r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(service.IMAGE_EXTENSIONS):
+                    yield f"{shard.path}::{member.name}", archive.extractfile(member).read()
+    else:
+        for path in shard.files:
+            with open(path, "rb") as f:
+                yield path, f.read()
+
+
+class ShardDataset(IterableDataset):
+    """Yields one preprocessed item per image, and an end marker after each
+    shard. Shards are divided between DataLoader workers, and a batch always
+    comes from one worker, so a shard's images all arrive before its marker."""
+
+    def __init__(self, shards):
+        self.shards = shards
+
+    def __iter__(self):
+        worker = get_worker_info()
+        shards = self.shards if worker is None else self.shards[worker.id::worker.num_workers]
+        for shard in shards:
+            for path, image_data in read_shard(shard):
+                try:
+                    yield {"shard": shard.id, "path": path, "tensor": service.preprocess_image(image_data)}
+                except Exception as e:
+                    yield {"shard": shard.id, "path": path, "error": repr(e)}
+            yield {"shard": shard.id, "end": True}
+
+
+def collate(items):
+    tensors = [item.pop("tensor") for item in items if "tensor" in item]
+    return (torch.stack(tensors) if tensors else None), items
+
+
+def part_path(parts_dir, shard, fmt):
+    return os.path.join(parts_dir, f"{shard.id}.{fmt}")
+
+
+def columns(probabilities):
+    names = ["path", "predicted_disease", "confidence", "error"]
+    if probabilities:
+        names.extend(service.class_labels)
+    return names
+
+
+def parquet_schema(probabilities):
+    import pyarrow as pa
+
+    fields = [
+        ("path", pa.string()),
+        ("predicted_disease", pa.string()),
+        ("confidence", pa.float64()),
+        ("error", pa.string()),
+    ]
+    if probabilities:
+        fields.extend((label, pa.float64()) for label in service.class_labels)
+    return pa.schema(fields)
+
+
+def write_part(path, rows, fmt, probabilities):
+    tmp_path = path + ".tmp"
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.Table.from_pylist(rows, schema=parquet_schema(probabilities)), tmp_path)
+    else:
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns(probabilities))
+            writer.writeheader()
+            writer.writerows(rows)
+    # The part only appears once complete, so its existence marks the shard done
+    os.replace(tmp_path, path)
+
+
+def merge_parts(paths, output, fmt, probabilities):
+    tmp_path = output + ".tmp"
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        with pq.ParquetWriter(tmp_path, parquet_schema(probabilities)) as writer:
+            for path in paths:
+                writer.write_table(pq.read_table(path))
+    else:
+        with open(tmp_path, "w", newline="") as out:
+            for index, path in enumerate(paths):
+                with open(path, newline="") as f:
+                    header = f.readline()
+                    if index == 0:
+                        out.write(header)
+                    for line in f:
+                        out.write(line)
+    os.replace(tmp_path, output)
+
+
+def score_shards(shards, args, parts_dir, fmt):
+    loader = DataLoader(
+        ShardDataset(shards),
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        collate_fn=collate,
+        prefetch_factor=args.prefetch if args.workers else None,
+    )
+    rows = collections.defaultdict(list)
+    by_id = {shard.id: shard for shard in shards}
+    scored = 0
+    finished = 0
+    started = time.perf_counter()
+
+    for batch, items in loader:
+        if batch is not None:
+            probabilities = torch.softmax(service.run_batch(batch).float(), 1)
+            confidences, predicted = probabilities.max(1)
+            scored += len(batch)
+        index = 0
+        for item in items:
+            if item.get("end"):
+                shard = by_id[item["shard"]]
+                write_part(part_path(parts_dir, shard, fmt), rows.pop(shard.id, []), fmt, args.probabilities)
+                finished += 1
+                continue
+            row = {"path": item["path"], "predicted_disease": None, "confidence": None, "error": item.get("error")}
+            if "error" not in item:
+                row["predicted_disease"] = service.class_labels[predicted[index].item()]
+                row["confidence"] = round(confidences[index].item(), 4)
+                if args.probabilities:
+                    row.update(zip(service.class_labels, probabilities[index].tolist()))
+                index += 1
+            rows[item["shard"]].append(row)
+
+        elapsed = time.perf_counter() - started
+        print(
+            f"\r{scored} images, {scored / elapsed:.1f} images/s, {finished}/{len(shards)} shards",
+            end="",
+            flush=True,
+        )
+    print()
+
+
+def main():
+    args = parse_args()
+    fmt = output_format(args.output)
+    shards = plan_shards(args.inputs, args.shard_size, settings_key(args))
+    parts_dir = args.output + ".parts"
+    os.makedirs(parts_dir, exist_ok=True)
+
+    todo = [shard for shard in shards if not os.path.exists(part_path(parts_dir, shard, fmt))]
+    print(f"{len(shards)} shards, {len(shards) - len(todo)} already scored")
+    if todo:
+        # The forward pass gets the cores the DataLoader workers don't use
+        torch.set_num_threads(args.threads or max(1, (os.cpu_count() or 1) - args.workers))
+        service.load_model()
+        score_shards(todo, args, parts_dir, fmt)
+
+    # Only parts of the current plan are merged, so shards left over from an
+    # earlier file listing or model are ignored
+    merge_parts([part_path(parts_dir, shard, fmt) for shard in shards], args.output, fmt, args.probabilities)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
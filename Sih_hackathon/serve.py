@@ -0,0 +1,116 @@
+"""Multi-process server: loads the model once, then forks worker processes
+that share its weights and accept connections on one listening socket.
+
+    python serve.py --workers 4 --port 8001
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import tempfile
+
+import torch
+import uvicorn
+
+import app as service
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the plant disease API from several worker processes")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", "1")))
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=None,
+        help="torch intra-op threads per worker, defaults to cores / workers",
+    )
+    return parser.parse_args()
+
+
+def run_worker(sock, threads):
+    # Split the cores between workers so their thread pools don't oversubscribe
+    torch.set_num_threads(threads)
+    service.WORKER_POOL_SIZE = threads
+    server = uvicorn.Server(uvicorn.Config(service.app, log_level="info"))
+    server.run(sockets=[sock])
+
+
+def spawn(sock, threads):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            run_worker(sock, threads)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    args = parse_args()
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Load before forking so every worker maps the same weights: the eager
+    # model is backed by the memory-mapped safetensors file, and backends
+    # built in memory are shared copy-on-write. The parent stays on one
+    # thread so no OpenMP pool exists at fork time. A CUDA context can't be
+    # used from a forked child and onnxruntime sessions own threads that
+    # don't survive fork, so on GPU or with onnx each worker loads its own
+    # model; the parent still writes the converted weights and ONNX graph
+    # first so workers don't race to create them.
+    torch.set_num_threads(1)
+    service.prepare_files()
+
+    # Each worker writes its metrics here, so a /metrics scrape, served by
+    # whichever worker accepts it, reports all of them
+    owns_metrics_dir = not service.registry.multiprocess_dir
+    if owns_metrics_dir:
+        service.registry.multiprocess_dir = tempfile.mkdtemp(prefix="plant-metrics-")
+    if service.device.type == "cpu" and service.INFERENCE_BACKEND != "onnx":
+        service.load_model()
+
+    workers = {spawn(sock, threads) for _ in range(args.workers)}
+    print(f"Serving on {args.host}:{args.port} with {args.workers} workers x {threads} threads")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, restarting")
+            workers.add(spawn(sock, threads))
+
+    if owns_metrics_dir:
+        shutil.rmtree(service.registry.multiprocess_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
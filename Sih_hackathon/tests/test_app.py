@@ -0,0 +1,121 @@
+import io
+import json
+import tarfile
+
+import pytest
+import torch
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import app as service
+from cache import PredictionCache
+
+PREDICTED = 3
+
+
+def fake_forward(batch):
+    # Every image gets class PREDICTED with a clear margin
+    outputs = torch.zeros(len(batch), service.num_classes)
+    outputs[:, PREDICTED] = 10.0
+    return outputs
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # The real model is never loaded: forward passes go to fake_forward and
+    # each test starts with an empty cache
+    monkeypatch.setattr(service, "prepare_model", lambda: None)
+    monkeypatch.setattr(service.batcher, "run_batch", fake_forward)
+    monkeypatch.setattr(service, "prediction_cache", PredictionCache())
+    service.model_ready.set()
+    try:
+        with TestClient(service.app) as client:
+            yield client
+    finally:
+        service.model_ready.clear()
+
+
+def png(index):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (40 * index, 120, 60)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def tar_of(images):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for index, data in enumerate(images):
+            info = tarfile.TarInfo(f"leaf-{index}.png")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_archive_reports_every_image(client):
+    response = client.post("/predict/batch", files={"archive": ("leaves.tar", tar_of([png(i) for i in range(4)]))})
+    assert response.status_code == 200
+    lines = ndjson(response)
+    assert sorted(line["index"] for line in lines) == [0, 1, 2, 3]
+    assert {line["predicted_disease"] for line in lines} == {service.class_labels[PREDICTED]}
+
+
+def test_truncated_archive_reports_images_read_before_the_cut(client):
+    images = [png(i) for i in range(4)]
+    # Each member is a 512 byte header plus its data padded to 512 bytes;
+    # cut halfway into the last member's data
+    last = sum(512 + -(-len(data) // 512) * 512 for data in images[:-1])
+    truncated = tar_of(images)[:last + 512 + len(images[-1]) // 2]
+
+    response = client.post("/predict/batch", files={"archive": ("leaves.tar", truncated)})
+    lines = ndjson(response)
+    assert lines[-1]["error"].startswith("Failed to read upload")
+    assert sorted(line["index"] for line in lines[:-1]) == [0, 1, 2]
+    assert all("predicted_disease" in line for line in lines[:-1])
+
+
+def test_predict_returns_the_predicted_class(client):
+    response = client.post("/predict", files={"file": ("leaf.png", png(1))})
+    assert response.status_code == 200
+    assert response.json()["predicted_disease"] == service.class_labels[PREDICTED]
+
+
+def test_predict_rejects_undecodable_upload_with_400(client):
+    response = client.post("/predict", files={"file": ("leaf.png", b"not an image")})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Could not decode image")
+    assert service.inflight == 0
+
+
+def test_predict_before_the_model_is_ready_returns_503(client):
+    service.model_ready.clear()
+    response = client.post("/predict", files={"file": ("leaf.png", png(1))})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(service.RETRY_AFTER_SECONDS)
+    assert response.json()["detail"] == "Model not loaded yet"
+
+
+def test_predict_over_max_inflight_returns_503(client, monkeypatch):
+    monkeypatch.setattr(service, "MAX_INFLIGHT", 0)
+    response = client.post("/predict", files={"file": ("leaf.png", png(1))})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(service.RETRY_AFTER_SECONDS)
+    assert response.json()["detail"] == "Server busy, retry later"
+    assert service.inflight == 0
+
+
+def test_predict_always_reports_confidence(client):
+    result = client.post("/predict", files={"file": ("leaf.png", png(1))}).json()
+    assert result["confidence"] > 0.99
+    assert result["uncertain"] is False
+    assert "top_k" not in result
+
+
+def test_format_prediction_flags_low_confidence():
+    result = service.format_prediction(torch.zeros(service.num_classes))
+    assert result["confidence"] == round(1 / service.num_classes, 4)
+    assert result["uncertain"] is True
+    assert len(service.format_prediction(torch.zeros(service.num_classes), top_k=3)["top_k"]) == 3
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+import torch
+
+from batching import MicroBatcher
+
+
+class RecordingModel:
+    """Returns each input row's sum, and records the size of every batch."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        return batch.sum(dim=1).clone()
+
+
+async def run_batcher(batcher, tensors):
+    batcher.start()
+    try:
+        return await asyncio.gather(*(batcher.submit(tensor) for tensor in tensors))
+    finally:
+        await batcher.stop()
+
+
+def test_each_caller_gets_its_own_row():
+    model = RecordingModel()
+    tensors = [torch.full((3,), float(i)) for i in range(5)]
+    results = asyncio.run(run_batcher(MicroBatcher(model, max_batch_size=8, max_wait_ms=50), tensors))
+    assert [result.item() for result in results] == [3.0 * i for i in range(5)]
+    assert model.batch_sizes == [5]
+
+
+def test_batches_are_capped_at_max_batch_size():
+    model = RecordingModel()
+    tensors = [torch.ones(3) for _ in range(10)]
+    asyncio.run(run_batcher(MicroBatcher(model, max_batch_size=4, max_wait_ms=50), tensors))
+    assert model.batch_sizes == [4, 4, 2]
+
+
+def test_lone_request_runs_after_the_wait_window():
+    model = RecordingModel()
+
+    async def scenario():
+        batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=20)
+        batcher.start()
+        try:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await batcher.submit(torch.ones(3))
+            return loop.time() - started
+        finally:
+            await batcher.stop()
+
+    elapsed = asyncio.run(scenario())
+    assert elapsed >= 0.015
+    assert model.batch_sizes == [1]
+
+
+def test_on_batch_reports_size_and_queue_waits():
+    batches = []
+
+    def on_batch(size, queue_waits, run_seconds):
+        batches.append((size, len(queue_waits), run_seconds))
+
+    tensors = [torch.ones(3) for _ in range(3)]
+    asyncio.run(run_batcher(MicroBatcher(RecordingModel(), max_wait_ms=20, on_batch=on_batch), tensors))
+    assert [(size, waits) for size, waits, _ in batches] == [(3, 3)]
+    assert batches[0][2] >= 0
+
+
+def test_model_errors_reach_every_caller_in_the_batch():
+    def failing(batch):
+        raise ValueError("bad batch")
+
+    async def scenario():
+        batcher = MicroBatcher(failing, max_wait_ms=20)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                *(batcher.submit(torch.ones(3)) for _ in range(2)), return_exceptions=True
+            )
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_submit_before_start_raises():
+    batcher = MicroBatcher(RecordingModel())
+    with pytest.raises(RuntimeError, match="not started"):
+        asyncio.run(batcher.submit(torch.ones(3)))
@@ -0,0 +1,68 @@
+import time
+
+from cache import PredictionCache
+
+
+def test_memory_hit_and_miss():
+    cache = PredictionCache(max_entries=10)
+    key = cache.key(b"image")
+    assert cache.get(key) is None
+    cache.put(key, [1.0, 2.0])
+    assert cache.get(key) == [1.0, 2.0]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_key_depends_on_namespace():
+    assert PredictionCache(namespace="a").key(b"image") != PredictionCache(namespace="b").key(b"image")
+
+
+def test_lru_eviction():
+    cache = PredictionCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_expiry(monkeypatch):
+    cache = PredictionCache(ttl_seconds=10)
+    cache.put("a", 1)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = PredictionCache(disk_path=path)
+    cache.put("a", [0.5])
+    cache.flush()
+
+    restarted = PredictionCache(disk_path=path)
+    assert restarted.get_memory("a") is None
+    assert restarted.get_disk("a") == [0.5]
+    # Disk hits are promoted to the memory tier
+    assert restarted.get_memory("a") == [0.5]
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.stats()["hits"] == 1
+
+
+def test_disk_miss_counts_once(tmp_path):
+    cache = PredictionCache(disk_path=str(tmp_path / "cache.db"))
+    assert cache.get("missing") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_tier_is_trimmed(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = PredictionCache(max_entries=1, disk_path=path, max_disk_entries=10)
+    for index in range(1000):
+        cache.put(str(index), index)
+    cache.flush()
+    count = cache._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+    assert count == 10
+    assert cache.get_disk("999") == 999
@@ -0,0 +1,46 @@
+import os
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def make_registry(directory=None):
+    registry = Registry(multiprocess_dir=directory)
+    counter = registry.register(Counter("requests_total", "Requests", ("route",)))
+    histogram = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    registry.register(Gauge("queue_depth", "Queue depth", lambda: 3))
+    return registry, counter, histogram
+
+
+def test_render_single_process():
+    registry, counter, histogram = make_registry()
+    counter.inc(route="/predict")
+    counter.inc(2, route="/predict")
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    text = registry.render()
+    assert 'requests_total{route="/predict"} 3.0' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "latency_seconds_count 2" in text
+    assert "queue_depth 3.0" in text
+
+
+def test_multiprocess_aggregation(tmp_path):
+    registry, counter, histogram = make_registry(str(tmp_path))
+    counter.inc(route="/predict")
+    histogram.observe(0.5)
+
+    # Another (exited) worker's snapshot: its counters still count, its
+    # gauges are dropped
+    other, other_counter, other_histogram = make_registry(str(tmp_path))
+    other_counter.inc(4, route="/predict")
+    other_histogram.observe(2.0)
+    other.write_snapshot()
+    os.replace(tmp_path / f"{os.getpid()}.json", tmp_path / "999999999.json")
+
+    text = registry.render()
+    assert 'requests_total{route="/predict"} 5.0' in text
+    assert 'latency_seconds_bucket{le="1.0"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert f'queue_depth{{worker="{os.getpid()}"}} 3.0' in text
+    assert 'worker="999999999"' not in text
@@ -0,0 +1,137 @@
+import io
+
+import numpy as np
+import pytest
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from preprocessing import (
+    CROP_SIZE,
+    MAX_ABS_TOLERANCE,
+    MEAN,
+    MEAN_ABS_TOLERANCE,
+    RESIZE_SIZE,
+    STD,
+    compare_with_reference,
+    plan_tiles,
+    preprocess,
+    preprocess_batch,
+    preprocess_tiles,
+    tile_offsets,
+)
+
+REFERENCE = transforms.Compose([
+    transforms.Resize(RESIZE_SIZE),
+    transforms.CenterCrop(CROP_SIZE),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=MEAN.tolist(), std=STD.tolist()),
+])
+
+# One uint8 level in normalized units, for the channel with the smallest std
+ONE_LEVEL = 1.0 / (255.0 * STD.min())
+
+
+def photo_like(width, height, seed=0):
+    # Upsampled low-resolution noise: smooth regions and edges like a photo
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    return Image.fromarray(small).resize((width, height), Image.BILINEAR)
+
+
+def encode(image, format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("size", [(640, 480), (480, 640), (300, 300), (1000, 257), (224, 224)])
+def test_png_matches_reference_up_to_rounding(size):
+    result = compare_with_reference(encode(photo_like(*size), "PNG"), REFERENCE)
+    # The same resampling is done in one step instead of resize-then-crop, so
+    # pixels may only differ by the final rounding to uint8
+    assert result["max_abs_diff"] <= ONE_LEVEL + 1e-5
+    assert result["mean_abs_diff"] < 1e-3
+
+
+@pytest.mark.parametrize("size", [(640, 480), (1600, 1200), (4000, 3000), (3000, 4000)])
+def test_jpeg_within_documented_tolerance(size):
+    result = compare_with_reference(encode(photo_like(*size, seed=1), "JPEG", quality=90), REFERENCE)
+    assert result["mean_abs_diff"] <= MEAN_ABS_TOLERANCE
+    assert result["max_abs_diff"] <= MAX_ABS_TOLERANCE
+
+
+def test_non_rgb_inputs_are_converted():
+    gray = photo_like(320, 240).convert("L")
+    tensor = preprocess(encode(gray, "PNG"))
+    assert tensor.shape == (3, CROP_SIZE, CROP_SIZE)
+    assert torch.allclose(tensor, REFERENCE(gray.convert("RGB")), atol=ONE_LEVEL + 1e-5)
+
+
+def test_preprocess_batch_matches_single_images():
+    images = [encode(photo_like(400 + 50 * i, 300, seed=i), "PNG") for i in range(3)]
+    batch = preprocess_batch(images)
+    assert batch.shape == (3, 3, CROP_SIZE, CROP_SIZE)
+    for row, image in zip(batch, images):
+        assert torch.equal(row, preprocess(image))
+
+
+def test_preprocess_batch_reuses_buffer():
+    buffer = torch.zeros(4, 3, CROP_SIZE, CROP_SIZE)
+    images = [encode(photo_like(300, 300, seed=i), "PNG") for i in range(2)]
+    batch = preprocess_batch(images, out=buffer)
+    assert batch.shape[0] == 2
+    assert batch.data_ptr() == buffer.data_ptr()
+    assert torch.equal(buffer[1], preprocess(images[1]))
+    assert not buffer[2:].any()
+
+
+@pytest.mark.parametrize("length", [224, 300, 448, 597, 896, 1195])
+@pytest.mark.parametrize("overlap", [0.0, 0.125, 0.25])
+def test_tile_offsets_cover_with_overlap(length, overlap):
+    offsets = tile_offsets(length, 224, overlap)
+    assert offsets[0] == 0
+    assert offsets[-1] == max(0, length - 224)
+    for previous, current in zip(offsets, offsets[1:]):
+        # Consecutive tiles leave no gap and overlap by at least `overlap`
+        assert current - previous <= 224 * (1 - overlap) + 1
+
+
+def test_tile_offsets_short_side():
+    assert tile_offsets(100, 224, 0.25) == [0]
+
+
+@pytest.mark.parametrize("size", [(4000, 3000), (3000, 4000), (3000, 3000), (1920, 1080)])
+def test_default_plan_uses_fine_level(size):
+    plan = plan_tiles(*size)
+    assert [level for level, *_ in plan] == [336, 672]
+    assert 1 + sum(len(xs) * len(ys) for *_, xs, ys in plan) <= 32
+
+
+def test_plan_reduces_overlap_before_dropping_level():
+    full = plan_tiles(4000, 2250, max_tiles=100)
+    capped = plan_tiles(4000, 2250, max_tiles=32)
+    assert [level for level, *_ in capped] == [336, 672]
+    fine_full, fine_capped = full[-1], capped[-1]
+    assert len(fine_capped[3]) * len(fine_capped[4]) < len(fine_full[3]) * len(fine_full[4])
+
+
+@pytest.mark.parametrize("max_tiles", [1, 5, 12, 40])
+def test_plan_respects_cap(max_tiles):
+    plan = plan_tiles(4000, 3000, max_tiles=max_tiles)
+    assert 1 + sum(len(xs) * len(ys) for *_, xs, ys in plan) <= max_tiles
+
+
+def test_plan_skips_levels_above_source_resolution():
+    assert plan_tiles(300, 200) == []
+    assert [level for level, *_ in plan_tiles(800, 600)] == [336]
+
+
+def test_preprocess_tiles():
+    data = encode(photo_like(1200, 900), "PNG")
+    tiles, boxes = preprocess_tiles(data)
+    assert tiles.shape == (len(boxes), 3, CROP_SIZE, CROP_SIZE)
+    assert torch.equal(tiles[0], preprocess(data))
+    for left, top, right, bottom in boxes:
+        assert 0 <= left < right <= 1
+        assert 0 <= top < bottom <= 1
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import retrieval
+from retrieval import FlatIndex
+
+
+def payload(name):
+    return {"page_content": f"about {name}", "metadata": {"source": f"{name}.pdf"}}
+
+
+@pytest.fixture
+def index():
+    return FlatIndex(
+        [[1.0, 0.0, 0.0], [0.0, 2.0, 0.0], [1.0, 1.0, 0.0], [0.0, 0.0, -3.0]],
+        [payload("x"), payload("y"), payload("xy"), payload("minus-z")],
+    )
+
+
+def test_search_ranks_by_cosine_similarity(index):
+    query = np.array([4.0, 1.0, 0.0])
+    hits = index.search(query, 3)
+    assert [hit["metadata"]["source"] for _, hit in hits] == ["x.pdf", "xy.pdf", "y.pdf"]
+    unit = query / np.linalg.norm(query)
+    expected = [unit[0], (unit[0] + unit[1]) / np.sqrt(2), unit[1]]
+    assert [score for score, _ in hits] == pytest.approx(expected, abs=1e-6)
+
+
+def test_search_caps_k_at_the_index_size(index):
+    hits = index.search([0.0, 0.0, 1.0], 10)
+    assert len(hits) == 4
+    assert hits[-1][1]["metadata"]["source"] == "minus-z.pdf"
+    assert hits[-1][0] == pytest.approx(-1.0)
+
+
+def test_search_empty_index_and_zero_query():
+    assert FlatIndex(np.zeros((0, 3)), []).search([1.0, 0.0, 0.0], 5) == []
+    hits = FlatIndex([[1.0, 0.0]], [payload("x")]).search([0.0, 0.0], 1)
+    assert hits[0][0] == 0.0
+
+
+def test_save_load_round_trip(index, tmp_path):
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    loaded = FlatIndex.load(path)
+    np.testing.assert_array_equal(loaded.vectors, index.vectors)
+    assert loaded.payloads == index.payloads
+    assert loaded.search([1.0, 1.0, 0.0], 2) == index.search([1.0, 1.0, 0.0], 2)
+
+
+def test_fingerprint_survives_round_trip_and_follows_content(index, tmp_path):
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    assert FlatIndex.load(path).fingerprint() == index.fingerprint()
+
+    changed_payload = FlatIndex(index.vectors, index.payloads[:-1] + [payload("other")])
+    changed_vector = FlatIndex(index.vectors[::-1], index.payloads)
+    assert changed_payload.fingerprint() != index.fingerprint()
+    assert changed_vector.fingerprint() != index.fingerprint()
+
+
+def test_search_normalises_the_query_and_formats_hits(index, monkeypatch):
+    queries = []
+
+    def embed(query):
+        queries.append(query)
+        return (1.0, 0.0, 0.0)
+
+    monkeypatch.setattr(retrieval, "_index", index)
+    monkeypatch.setattr(retrieval, "embed_query", embed)
+    results = retrieval.search("  Apple   SCAB ", k=1)
+    assert queries == ["apple scab"]
+    assert results == [{"score": pytest.approx(1.0), "text": "about x", "metadata": {"source": "x.pdf"}}]
@@ -0,0 +1,44 @@
+import os
+
+import torch
+from safetensors.torch import load_file, save_file
+
+
+def safetensors_path(checkpoint_path):
+    return os.path.splitext(checkpoint_path)[0] + ".safetensors"
+
+
+def convert_checkpoint(checkpoint_path, output_path):
+    # One-off conversion of a torch.save state dict to safetensors
+    print(f"Converting {checkpoint_path} to {output_path}")
+    state_dict = torch.load(checkpoint_path, map_location="cpu")
+    # Per-process temporary name, in case several processes convert at once
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    save_file({name: tensor.contiguous() for name, tensor in state_dict.items()}, tmp_path)
+    os.replace(tmp_path, output_path)
+
+
+def load_mapped_state_dict(path):
+    # safetensors memory-maps the file and builds the tensors on top of the
+    # mapping, so every process loading the same file shares its pages
+    return load_file(path, device="cpu")
+
+
+def assign_state_dict(model, state_dict):
+    """Points the model's parameters and buffers at the given tensors instead
+    of copying into them like load_state_dict does, keeping the weights
+    backed by the mapped file. Works on models built on the meta device."""
+    expected = set(model.state_dict())
+    missing = expected - set(state_dict)
+    unexpected = set(state_dict) - expected
+    if missing or unexpected:
+        raise RuntimeError(f"State dict mismatch, missing: {sorted(missing)}, unexpected: {sorted(unexpected)}")
+
+    for name, tensor in state_dict.items():
+        module_name, _, attr = name.rpartition(".")
+        module = model.get_submodule(module_name)
+        if attr in module._parameters:
+            module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            module._buffers[attr] = tensor
+    return model
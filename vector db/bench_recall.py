@@ -0,0 +1,180 @@
+"""Recall vs latency of collection storage configurations.
+
+Copies the vectors of the ingested collection into one temporary collection
+per configuration, then compares approximate search on each against exact
+search on the original:
+
+    python bench_recall.py --configs baseline,scalar,product --hnsw-ef 32,64,128
+"""
+import argparse
+import json
+import random
+import time
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from injest import COLLECTION_NAME, EMBEDDING_MODEL, create_collection
+
+BASE_OPTIONS = {
+    "quantization": "none",
+    "quantized_always_ram": True,
+    "on_disk": False,
+    "hnsw_m": None,
+    "hnsw_ef_construct": None,
+    "hnsw_on_disk": False,
+    "payload_indexes": ["metadata.source"],
+}
+
+CONFIGS = {
+    "baseline": {},
+    "ondisk": {"on_disk": True},
+    "scalar": {"quantization": "scalar"},
+    "scalar-ondisk": {"quantization": "scalar", "on_disk": True},
+    "product": {"quantization": "product"},
+    "product-ondisk": {"quantization": "product", "on_disk": True},
+    "hnsw-m8": {"hnsw_m": 8, "hnsw_ef_construct": 64},
+    "hnsw-m32": {"hnsw_m": 32, "hnsw_ef_construct": 256},
+}
+
+# Bytes per vector kept in RAM, for the RAM estimate in the report
+QUANTIZED_BYTES_PER_DIM = {"none": 0, "scalar": 1, "product": 4 / 16}
+
+
+def read_points(client, collection):
+    ids, vectors, payloads = [], [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(collection, limit=1000, offset=offset, with_payload=True, with_vectors=True)
+        for point in points:
+            ids.append(point.id)
+            vectors.append(point.vector)
+            payloads.append(point.payload)
+        if offset is None:
+            return ids, vectors, payloads
+
+
+def wait_until_indexed(client, collection, timeout=600):
+    deadline = time.monotonic() + timeout
+    while client.get_collection(collection).status != models.CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{collection} was not indexed within {timeout}s")
+        time.sleep(0.5)
+
+
+def run_queries(client, collection, queries, k, params):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = client.search(collection, query_vector=query, limit=k, search_params=params)
+        latencies.append(time.perf_counter() - start)
+        results.append([hit.id for hit in hits])
+    latencies.sort()
+    return results, {
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "p95_ms": 1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+    }
+
+
+def recall(expected, actual):
+    hits = sum(len(set(e) & set(a)) for e, a in zip(expected, actual))
+    total = sum(len(e) for e in expected)
+    return hits / total if total else None
+
+
+def estimated_ram_bytes(options, count, dimension):
+    vectors = 0 if options["on_disk"] else count * dimension * 4
+    quantized = QUANTIZED_BYTES_PER_DIM[options["quantization"]] * count * dimension
+    if not options["quantized_always_ram"]:
+        quantized = 0
+    return int(vectors + quantized)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall and latency of collection configurations")
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--configs", default="baseline,scalar,product,hnsw-m8", help=f"from {sorted(CONFIGS)}")
+    parser.add_argument("--hnsw-ef", default="16,64,128", help="search-time ef values to sweep")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=200, help="stored vectors sampled as queries")
+    parser.add_argument("--queries-file", default=None, help="text queries, one per line, embedded instead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the temporary collections")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.url, prefer_grpc=False)
+    ids, vectors, payloads = read_points(client, args.collection)
+    dimension = len(vectors[0])
+
+    if args.queries_file:
+        from embedder import CachedEmbeddings
+
+        with open(args.queries_file) as f:
+            texts = [line.strip() for line in f if line.strip()]
+        queries = CachedEmbeddings(EMBEDDING_MODEL).embed_documents(texts)
+    else:
+        queries = random.Random(args.seed).sample(vectors, min(args.num_queries, len(vectors)))
+
+    # The source collection may itself be quantized, so the ground truth
+    # skips quantized vectors and scores the originals
+    exact = models.SearchParams(exact=True, quantization=models.QuantizationSearchParams(ignore=True))
+    ground_truth, exact_latency = run_queries(client, args.collection, queries, args.k, exact)
+
+    report = {
+        "collection": args.collection,
+        "points": len(ids),
+        "dimension": dimension,
+        "queries": len(queries),
+        "k": args.k,
+        "exact": exact_latency,
+        "configs": [],
+    }
+    ef_values = [int(value) for value in args.hnsw_ef.split(",")]
+    for name in args.configs.split(","):
+        options = dict(BASE_OPTIONS, **CONFIGS[name])
+        bench_collection = f"{args.collection}__bench_{name}"
+        if bench_collection in {c.name for c in client.get_collections().collections}:
+            client.delete_collection(bench_collection)
+        # A tiny indexing threshold forces an HNSW index even on small corpora
+        create_collection(client, bench_collection, dimension, options, indexing_threshold=1)
+        start = time.perf_counter()
+        client.upload_collection(bench_collection, vectors=vectors, payload=payloads, ids=ids, batch_size=256)
+        wait_until_indexed(client, bench_collection)
+        build_seconds = time.perf_counter() - start
+
+        rescore_modes = [True, False] if options["quantization"] != "none" else [None]
+        for ef in ef_values:
+            for rescore in rescore_modes:
+                params = models.SearchParams(
+                    hnsw_ef=ef,
+                    quantization=models.QuantizationSearchParams(rescore=rescore) if rescore is not None else None,
+                )
+                results, latency = run_queries(client, bench_collection, queries, args.k, params)
+                entry = {
+                    "config": name,
+                    "options": options,
+                    "hnsw_ef": ef,
+                    "rescore": rescore,
+                    "recall": recall(ground_truth, results),
+                    "latency": latency,
+                    "build_seconds": build_seconds,
+                    "estimated_ram_bytes": estimated_ram_bytes(options, len(ids), dimension),
+                }
+                report["configs"].append(entry)
+                print(f"{name:16} ef={ef:<4} rescore={rescore!s:5} recall={entry['recall']:.3f} p50={latency['p50_ms']:.2f}ms")
+
+        if not args.keep:
+            client.delete_collection(bench_collection)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import functools
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import UnstructuredFileLoader
+
+# character: the original fixed-size character splitter
+# token:     same recursive splitting, measured in embedding-model tokens
+# structure: sections grouped under their headings and tables kept whole,
+#            packed up to chunk_size tokens
+STRATEGIES = ("character", "token", "structure")
+
+# unstructured's default "auto" strategy reads PDFs with extractable text
+# through the fast text path, which never emits Table elements. The structure
+# strategy asks for layout detection with table inference instead (slower;
+# uses unstructured-inference). In unstructured 0.12 table inference on PDFs
+# is controlled by pdf_infer_table_structure and skip_infer_table_types.
+STRUCTURE_LOADER_OPTIONS = {
+    "strategy": "hi_res",
+    "pdf_infer_table_structure": True,
+    "skip_infer_table_types": [],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model_name):
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def token_splitter(settings):
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        get_tokenizer(settings["model"]),
+        chunk_size=settings["chunk_size"],
+        chunk_overlap=settings["chunk_overlap"],
+    )
+
+
+def chunk_file(path, settings):
+    """Returns [(text, metadata)] for one file according to settings
+    (strategy, chunk_size, chunk_overlap and the embedding model name)."""
+    strategy = settings["strategy"]
+    if strategy == "character":
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=settings["chunk_size"], chunk_overlap=settings["chunk_overlap"]
+        )
+        return [(chunk.page_content, {}) for chunk in splitter.split_documents(UnstructuredFileLoader(path).load())]
+    if strategy == "token":
+        splitter = token_splitter(settings)
+        return [(chunk.page_content, {}) for chunk in splitter.split_documents(UnstructuredFileLoader(path).load())]
+    if strategy == "structure":
+        elements = UnstructuredFileLoader(path, mode="elements", **STRUCTURE_LOADER_OPTIONS).load()
+        return chunk_by_structure(elements, settings)
+    raise ValueError(f"Unknown chunking strategy {strategy!r}, expected one of {STRATEGIES}")
+
+
+def sections(elements):
+    # Yields (heading, category, text, page) blocks: the body under each Title,
+    # and every Table on its own
+    heading, body, page = "", [], None
+    for element in elements:
+        category = element.metadata.get("category")
+        text = element.page_content.strip()
+        if not text:
+            continue
+        if category == "Title":
+            if body:
+                yield heading, "Section", "\n".join(body), page
+            heading, body, page = text, [], element.metadata.get("page_number")
+        elif category == "Table":
+            yield heading, "Table", text, element.metadata.get("page_number")
+        else:
+            if page is None:
+                page = element.metadata.get("page_number")
+            body.append(text)
+    if body:
+        yield heading, "Section", "\n".join(body), page
+
+
+def chunk_by_structure(elements, settings):
+    tokenizer = get_tokenizer(settings["model"])
+    limit = settings["chunk_size"]
+    splitter = token_splitter(settings)
+
+    def length(text):
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    chunks = []
+    packed, packed_length, packed_meta = [], 0, None
+
+    def emit_packed():
+        if packed:
+            chunks.append(("\n\n".join(packed), packed_meta))
+
+    for heading, category, text, page in sections(elements):
+        prefix = f"{heading}\n" if heading else ""
+        metadata = {"heading": heading, "category": category, "page_number": page}
+        block = prefix + text
+        block_length = length(block)
+
+        if block_length > limit:
+            # Oversized sections and tables are split, repeating the heading
+            emit_packed()
+            packed, packed_length = [], 0
+            budget = dict(settings, chunk_size=max(limit - length(prefix), limit // 2))
+            for piece in token_splitter(budget).split_text(text) if prefix else splitter.split_text(text):
+                chunks.append((prefix + piece, metadata))
+        elif category == "Table" or packed_length + block_length > limit:
+            emit_packed()
+            if category == "Table":
+                chunks.append((block, metadata))
+                packed, packed_length = [], 0
+            else:
+                packed, packed_length, packed_meta = [block], block_length, metadata
+        else:
+            # Small consecutive sections share a chunk
+            if not packed:
+                packed_meta = metadata
+            packed.append(block)
+            packed_length += block_length
+    emit_packed()
+    return chunks
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+import torch
+from langchain_core.embeddings import Embeddings
+
+BACKENDS = ("torch", "int8", "onnx")
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by model identity and text hash."""
+
+    def __init__(self, path, model_id):
+        self.model_id = model_id.encode()
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self.db.commit()
+
+    def key(self, text):
+        return hashlib.sha256(self.model_id + b"\0" + text.encode()).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        # Stay under SQLite's bound parameter limit
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+        )
+        self.db.commit()
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name, quantize=False):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        if quantize:
+            # Dynamic int8 covers every nn.Linear, which is most of BERT's compute
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, texts):
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+
+class OnnxEncoder:
+    """Runs the transformer with onnxruntime and mean-pools the token
+    embeddings, matching the sentence-transformers config of
+    NeuML/pubmedbert-base-embeddings."""
+
+    def __init__(self, model_name, onnx_dir="onnx", num_threads=None):
+        import onnxruntime as ort
+        from transformers import AutoModel, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.max_length = min(self.tokenizer.model_max_length, 512)
+        path = os.path.join(onnx_dir, model_name.replace("/", "__") + ".onnx")
+        if not os.path.exists(path):
+            print(f"Exporting {model_name} to {path}")
+            os.makedirs(onnx_dir, exist_ok=True)
+            model = AutoModel.from_pretrained(model_name).eval()
+            sample = self.tokenizer(["export sample"], return_tensors="pt")
+            axes = {0: "batch", 1: "sequence"}
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+                path,
+                input_names=["input_ids", "attention_mask", "token_type_ids"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={"input_ids": axes, "attention_mask": axes, "token_type_ids": axes, "last_hidden_state": axes},
+                opset_version=17,
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def encode(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        inputs = {name: tokens[name].astype(np.int64) for name in ("input_ids", "attention_mask", "token_type_ids")}
+        hidden = self.session.run(None, inputs)[0]
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(1) / np.clip(mask.sum(1), 1e-9, None)
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings with a persistent cache, length-bucketed batches
+    (texts of similar length are encoded together to minimise padding) and
+    a choice of torch, dynamic int8 or onnxruntime encoders."""
+
+    def __init__(self, model_name, backend="torch", batch_size=32, num_threads=None, cache_path=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if backend == "onnx":
+            self.encoder = OnnxEncoder(model_name, num_threads=num_threads)
+        else:
+            self.encoder = SentenceTransformerEncoder(model_name, quantize=backend == "int8")
+        self.batch_size = batch_size
+        self.cache = EmbeddingCache(cache_path, f"{model_name}:{backend}") if cache_path else None
+        self.cache_hits = 0
+        self.encoded = 0
+        self.encode_seconds = 0.0
+
+    def embed_documents(self, texts):
+        keys = [self.cache.key(text) for text in texts] if self.cache else list(range(len(texts)))
+        vectors = self.cache.get_many(keys) if self.cache else {}
+        self.cache_hits += sum(1 for key in keys if key in vectors)
+
+        # Unique uncached texts, longest first, cut into batches
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        ordered = sorted(missing.items(), key=lambda item: len(item[1]), reverse=True)
+
+        start = time.perf_counter()
+        for offset in range(0, len(ordered), self.batch_size):
+            batch = ordered[offset:offset + self.batch_size]
+            encoded = self.encoder.encode([text for _, text in batch])
+            for (key, _), vector in zip(batch, encoded):
+                vectors[key] = np.asarray(vector, dtype=np.float32).tolist()
+        self.encode_seconds += time.perf_counter() - start
+        self.encoded += len(ordered)
+
+        if self.cache and ordered:
+            self.cache.put_many([(key, vectors[key]) for key, _ in ordered])
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -1,32 +1,482 @@
+import argparse
+import collections
+import hashlib
+import json
+import multiprocessing
 import os
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.document_loaders import UnstructuredFileLoader, DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Qdrant
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-# Use the updated HuggingFaceEmbeddings class
-embeddings = HuggingFaceEmbeddings(model_name="NeuML/pubmedbert-base-embeddings")
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
 
-print(embeddings)
+from chunking import STRATEGIES, chunk_file
+from embedder import BACKENDS, CachedEmbeddings
 
-# Correct the glob pattern to be relative
-loader = DirectoryLoader('data/', glob="**/*.pdf", show_progress=True, loader_cls=UnstructuredFileLoader)
+EMBEDDING_MODEL = "NeuML/pubmedbert-base-embeddings"
+COLLECTION_NAME = "crop_vector_db"
+CHUNK_STRATEGY = "character"
+CHUNK_SIZE = 150
+CHUNK_OVERLAP = 20
+GUIDANCE_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Sih_hackathon", "guidance_index.json")
+QUANTIZATION_MODES = ("none", "scalar", "product")
 
-documents = loader.load()
+# Point ids are derived from (source, file hash, chunking settings, chunk
+# index) so re-runs upsert the same ids and any content or settings change
+# produces new ones
+POINT_NAMESPACE = uuid.UUID("5b0d1c7e-7f49-4a55-9d8e-4c1b3c1f2a60")
 
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=150, chunk_overlap=20)
 
-texts = text_splitter.split_documents(documents)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Incrementally ingest PDFs into the crop vector collection")
+    parser.add_argument("--data-dir", default="data/")
+    parser.add_argument("--url", default=os.environ.get("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument(
+        "--manifest",
+        default=os.environ.get("INGEST_MANIFEST", "ingest_manifest.json"),
+        help="per-file content hashes of the last run",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes parsing PDFs")
+    parser.add_argument("--batch-size", type=int, default=256, help="chunks embedded and upserted at a time")
+    parser.add_argument("--embed-batch-size", type=int, default=32, help="texts per encoder call")
+    parser.add_argument("--embed-threads", type=int, default=None, help="intra-op threads for the encoder")
+    parser.add_argument("--embed-backend", choices=BACKENDS, default="torch")
+    parser.add_argument(
+        "--embedding-cache",
+        default=os.environ.get("EMBEDDING_CACHE", "embedding_cache.sqlite"),
+        help="'' disables the cache",
+    )
+    parser.add_argument("--chunk-strategy", choices=STRATEGIES, default=CHUNK_STRATEGY)
+    parser.add_argument(
+        "--chunk-size", type=int, default=CHUNK_SIZE, help="characters for 'character', tokens otherwise"
+    )
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES, default="none")
+    parser.add_argument(
+        "--quantized-on-disk", action="store_true", help="keep quantized vectors on disk instead of always in RAM"
+    )
+    parser.add_argument("--on-disk", action="store_true", help="store original vectors on disk and mmap them")
+    parser.add_argument("--hnsw-m", type=int, default=None)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=None)
+    parser.add_argument("--hnsw-on-disk", action="store_true")
+    parser.add_argument(
+        "--payload-index",
+        action="append",
+        default=None,
+        help="keyword payload field to index, repeatable (default: metadata.source)",
+    )
+    parser.add_argument("--full", action="store_true", help="re-embed every file, even unchanged ones")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="chunk and embed every file without touching Qdrant or the manifest"
+    )
+    parser.add_argument("--report", default=None, help="append a JSON line with chunking/embedding stats here")
+    parser.add_argument(
+        "--guidance-index",
+        default=os.environ.get("GUIDANCE_INDEX", GUIDANCE_INDEX),
+        help="guidance index built from this collection, marked stale when the collection changes",
+    )
+    return parser.parse_args()
 
-print(texts[1])
 
-url = "http://localhost:6333"
-qdrant = Qdrant.from_documents(
-    texts,
-    embeddings,
-    url=url,
-    prefer_grpc=False,
-    collection_name="crop_vector_db"
-)
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-print("Vector DB Successfully Created!")
+
+def scan(data_dir):
+    files = {}
+    for root, _, names in os.walk(data_dir):
+        for name in sorted(names):
+            if name.lower().endswith(".pdf"):
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, data_dir)] = file_hash(path)
+    return files
+
+
+def settings_key(settings):
+    # Identifies how chunks were produced. It is stored with every point, so
+    # a run without the manifest can tell which stored files are current
+    chunking = {name: value for name, value in settings.items() if name != "storage"}
+    return hashlib.sha256(json.dumps(chunking, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def mark_guidance_stale(path):
+    # Clearing the fingerprint makes `guidance.py build` rebuild the index,
+    # and the prediction API flags guidance served from it until then
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        index = json.load(f)
+    index["stale"] = True
+    index["fingerprint"] = None
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+    return True
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_and_split(data_dir, source, settings):
+    # Runs in a worker process: parse one file and return its chunks
+    return chunk_file(os.path.join(data_dir, source), settings)
+
+
+def source_filter(source, keep_hash=None, keep_settings=None):
+    # Matches the points of source, except those of the file version with
+    # keep_hash chunked with keep_settings
+    keep = None
+    if keep_hash:
+        keep = [models.Filter(must=[
+            models.FieldCondition(key="metadata.file_hash", match=models.MatchValue(value=keep_hash)),
+            models.FieldCondition(key="metadata.settings", match=models.MatchValue(value=keep_settings)),
+        ])]
+    return models.Filter(
+        must=[models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source))],
+        must_not=keep,
+    )
+
+
+def stored_files(client, collection, key):
+    # Rebuilds the manifest's file list from the point payloads. A file
+    # counts as stored only when all of its chunks are there, from a single
+    # version of the file, chunked with the current settings; any other
+    # file maps to None, so it is ingested again, or deleted if it is gone
+    versions = collections.defaultdict(collections.Counter)
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection, limit=1000, offset=offset, with_payload=["metadata"], with_vectors=False
+        )
+        for point in points:
+            metadata = (point.payload or {}).get("metadata", {})
+            if "source" in metadata:
+                version = (metadata.get("file_hash"), metadata.get("settings"), metadata.get("chunk_count"))
+                versions[metadata["source"]][version] += 1
+        if offset is None:
+            break
+
+    files = {}
+    for source, counts in versions.items():
+        files[source] = None
+        if len(counts) == 1:
+            (digest, stored_key, chunk_count), stored = next(iter(counts.items()))
+            if stored_key == key and stored == chunk_count:
+                files[source] = digest
+    return files
+
+
+def plan_changes(current, previous, full=False):
+    # Returns the files to ingest (new, changed, or not fully stored) and
+    # the files whose vectors are deleted because they left data_dir
+    pending = [source for source, digest in current.items() if full or previous.get(source) != digest]
+    removed = [source for source in previous if source not in current]
+    return pending, removed
+
+
+def storage_options(args):
+    return {
+        "quantization": args.quantization,
+        "quantized_always_ram": not args.quantized_on_disk,
+        "on_disk": args.on_disk,
+        "hnsw_m": args.hnsw_m,
+        "hnsw_ef_construct": args.hnsw_ef_construct,
+        "hnsw_on_disk": args.hnsw_on_disk,
+        "payload_indexes": args.payload_index or ["metadata.source"],
+    }
+
+
+def create_collection(client, collection, dimension, options, indexing_threshold=None):
+    quantization = None
+    if options["quantization"] == "scalar":
+        quantization = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=options["quantized_always_ram"]
+            )
+        )
+    elif options["quantization"] == "product":
+        quantization = models.ProductQuantization(
+            product=models.ProductQuantizationConfig(
+                compression=models.CompressionRatio.X16, always_ram=options["quantized_always_ram"]
+            )
+        )
+
+    client.create_collection(
+        collection,
+        vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE, on_disk=options["on_disk"]),
+        hnsw_config=models.HnswConfigDiff(
+            m=options["hnsw_m"], ef_construct=options["hnsw_ef_construct"], on_disk=options["hnsw_on_disk"]
+        ),
+        # mmap segments as soon as they are written when vectors live on disk
+        optimizers_config=models.OptimizersConfigDiff(
+            memmap_threshold=1 if options["on_disk"] else None, indexing_threshold=indexing_threshold
+        ),
+        quantization_config=quantization,
+    )
+    for field in options["payload_indexes"]:
+        client.create_payload_index(collection, field_name=field, field_schema=models.PayloadSchemaType.KEYWORD)
+
+
+def collection_matches(info, dimension, options):
+    # Whether an existing collection has the vector and storage configuration
+    # create_collection would give it. HNSW parameters left unset accept
+    # whatever the collection has
+    config = info.config
+    vectors = config.params.vectors
+    hnsw = config.hnsw_config
+    quantization = config.quantization_config
+    if isinstance(quantization, models.ScalarQuantization):
+        mode, always_ram = "scalar", quantization.scalar.always_ram
+    elif isinstance(quantization, models.ProductQuantization):
+        mode, always_ram = "product", quantization.product.always_ram
+    else:
+        mode, always_ram = "none", None
+    return (
+        isinstance(vectors, models.VectorParams)
+        and vectors.size == dimension
+        and vectors.distance == models.Distance.COSINE
+        and bool(vectors.on_disk) == options["on_disk"]
+        and options["hnsw_m"] in (None, hnsw.m)
+        and options["hnsw_ef_construct"] in (None, hnsw.ef_construct)
+        and bool(hnsw.on_disk) == options["hnsw_on_disk"]
+        and mode == options["quantization"]
+        and (mode == "none" or bool(always_ram) == options["quantized_always_ram"])
+    )
+
+
+def ensure_collection(client, collection, dimension, options):
+    # The live collection is only dropped when its configuration can't serve
+    # the requested settings; returns True when the collection starts empty
+    if collection in {c.name for c in client.get_collections().collections}:
+        info = client.get_collection(collection)
+        if collection_matches(info, dimension, options):
+            for field in options["payload_indexes"]:
+                if field not in (info.payload_schema or {}):
+                    client.create_payload_index(
+                        collection, field_name=field, field_schema=models.PayloadSchemaType.KEYWORD
+                    )
+            return False
+        print(f"Recreating {collection}: its vector or storage configuration differs from the settings")
+        client.delete_collection(collection)
+    create_collection(client, collection, dimension, options)
+    return True
+
+
+class Writer:
+    """Buffers chunks from any number of files, embeds and upserts them in
+    fixed-size batches, and reports files whose chunks are all stored."""
+
+    def __init__(self, client, collection, embeddings, batch_size, settings_key=""):
+        self.client = client
+        self.collection = collection
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.settings_key = settings_key
+        self.buffer = []
+        self.remaining = {}
+        self.chunks_written = 0
+        self.text_chars = 0
+        self.payload_bytes = 0
+
+    def add_file(self, source, digest, chunks):
+        self.remaining[source] = len(chunks)
+        for index, (text, extra) in enumerate(chunks):
+            point_id = str(uuid.uuid5(POINT_NAMESPACE, f"{source}:{digest}:{self.settings_key}:{index}"))
+            metadata = dict(
+                extra,
+                source=source,
+                file_hash=digest,
+                settings=self.settings_key,
+                chunk=index,
+                chunk_count=len(chunks),
+            )
+            payload = {"page_content": text, "metadata": metadata}
+            self.buffer.append((source, point_id, text, payload))
+        completed = [source] if not chunks else []
+        while len(self.buffer) >= self.batch_size:
+            completed += self.flush(self.batch_size)
+        return completed
+
+    def flush(self, count=None):
+        if count is None:
+            count = len(self.buffer)
+        batch, self.buffer = self.buffer[:count], self.buffer[count:]
+        if not batch:
+            return []
+        vectors = self.embeddings.embed_documents([text for _, _, text, _ in batch])
+        if self.client is not None:
+            self.client.upsert(
+                self.collection,
+                points=models.Batch(
+                    ids=[point_id for _, point_id, _, _ in batch],
+                    vectors=vectors,
+                    payloads=[payload for _, _, _, payload in batch],
+                ),
+            )
+        self.chunks_written += len(batch)
+        self.text_chars += sum(len(text) for _, _, text, _ in batch)
+        self.payload_bytes += sum(len(json.dumps(payload)) for _, _, _, payload in batch)
+
+        completed = []
+        for source, _, _, _ in batch:
+            self.remaining[source] -= 1
+            if self.remaining[source] == 0:
+                completed.append(source)
+        return completed
+
+
+def write_report(path, report):
+    with open(path, "a") as f:
+        f.write(json.dumps(report) + "\n")
+
+
+def main():
+    args = parse_args()
+    settings = {
+        "model": EMBEDDING_MODEL,
+        "embed_backend": args.embed_backend,
+        "strategy": args.chunk_strategy,
+        "chunk_size": args.chunk_size,
+        "chunk_overlap": args.chunk_overlap,
+        "storage": storage_options(args),
+    }
+
+    key = settings_key(settings)
+    current = scan(args.data_dir)
+
+    # Parser processes start on the first submit, after torch is loaded, so
+    # they are spawned rather than forked from a process that holds torch's threads
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    embeddings = CachedEmbeddings(
+        EMBEDDING_MODEL,
+        backend=args.embed_backend,
+        batch_size=args.embed_batch_size,
+        num_threads=args.embed_threads,
+        cache_path=args.embedding_cache or None,
+    )
+    dimension = len(embeddings.embed_query("dimension probe"))
+    client = None
+    previous = {}
+    if not args.dry_run:
+        client = QdrantClient(url=args.url, prefer_grpc=False)
+        manifest = load_manifest(args.manifest)
+        if not ensure_collection(client, args.collection, dimension, settings["storage"]):
+            if manifest.get("settings") == settings:
+                previous = manifest.get("files", {})
+            else:
+                # No manifest from the last run (a fresh checkout, another
+                # machine, a new container) or one written with other
+                # settings: the point payloads record what is stored
+                print(f"Reading the stored files from {args.collection}")
+                previous = stored_files(client, args.collection, key)
+
+    pending, removed = plan_changes(current, previous, args.full)
+    print(f"{len(current)} files: {len(pending)} to ingest, {len(removed)} removed")
+
+    files = {source: previous[source] for source in current if source in previous and source not in pending}
+    if client is not None:
+        for source in removed:
+            client.delete(args.collection, points_selector=models.FilterSelector(filter=source_filter(source)))
+        save_manifest(args.manifest, {"settings": settings, "files": files})
+
+    def finish(sources):
+        for source in sources:
+            if client is not None:
+                # Drop the vectors of the file's previous version, if any
+                client.delete(
+                    args.collection,
+                    points_selector=models.FilterSelector(
+                        filter=source_filter(source, keep_hash=current[source], keep_settings=key)
+                    ),
+                )
+            files[source] = current[source]
+            print(f"Ingested {source}")
+        if sources and client is not None:
+            save_manifest(args.manifest, {"settings": settings, "files": files})
+
+    writer = Writer(client, args.collection, embeddings, args.batch_size, settings_key=key)
+    failed = {}
+    start = time.perf_counter()
+    queue = list(pending)
+    running = {}
+    with pool:
+        # Keep at most two files per worker parsed ahead of the embedder
+        while queue or running:
+            while queue and len(running) < 2 * args.workers:
+                source = queue.pop(0)
+                running[pool.submit(load_and_split, args.data_dir, source, settings)] = source
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                source = running.pop(future)
+                try:
+                    chunks = future.result()
+                except Exception as e:
+                    # The file keeps its stored vectors and manifest entry,
+                    # so the next run tries it again
+                    failed[source] = repr(e)
+                    if previous.get(source) is not None:
+                        files[source] = previous[source]
+                    print(f"Failed to load {source}: {e!r}")
+                    continue
+                finish(writer.add_file(source, current[source], chunks))
+        finish(writer.flush())
+    if failed and client is not None:
+        save_manifest(args.manifest, {"settings": settings, "files": files})
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Stored {writer.chunks_written} chunks in {elapsed:.1f}s "
+        f"({writer.chunks_written / elapsed if elapsed else 0:.1f} chunks/sec): "
+        f"{embeddings.encoded} encoded at {embeddings.encoded / embeddings.encode_seconds if embeddings.encode_seconds else 0:.1f}/sec, "
+        f"{embeddings.cache_hits} from the embedding cache"
+    )
+
+    if args.report:
+        # Index size is estimated as raw float32 vectors plus JSON payloads,
+        # using this run's average payload size
+        points = writer.chunks_written if client is None else client.count(args.collection).count
+        avg_payload = writer.payload_bytes / writer.chunks_written if writer.chunks_written else None
+        write_report(args.report, {
+            "settings": settings,
+            "dry_run": args.dry_run,
+            "files": len(pending),
+            "failed": failed,
+            "chunks": writer.chunks_written,
+            "avg_chunk_chars": writer.text_chars / writer.chunks_written if writer.chunks_written else None,
+            "embed_seconds": embeddings.encode_seconds,
+            "encoded": embeddings.encoded,
+            "cache_hits": embeddings.cache_hits,
+            "total_seconds": elapsed,
+            "collection_points": points,
+            "estimated_index_bytes": points * (dimension * 4 + avg_payload) if avg_payload else None,
+        })
+        print(f"Report appended to {args.report}")
+
+    if failed:
+        print(f"{len(failed)} files failed to load: {', '.join(sorted(failed))}")
+    if not args.dry_run:
+        print("Vector DB Successfully Updated!")
+        if (pending or removed) and mark_guidance_stale(args.guidance_index):
+            print(f"Marked {args.guidance_index} stale, rebuild it with `python guidance.py build`")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The ingestion modules import each other as top-level modules, as they do
+# when run from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,145 @@
+from types import SimpleNamespace
+
+from qdrant_client.http import models
+
+from injest import Writer, collection_matches, plan_changes, source_filter, storage_options, stored_files
+
+
+class StubEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 0.0] for text in texts]
+
+
+class StubClient:
+    """Records upserts, and serves scroll pages from a list of payloads."""
+
+    def __init__(self, payloads=(), page_size=2):
+        self.payloads = list(payloads)
+        self.page_size = page_size
+        self.upserts = []
+
+    def upsert(self, collection, points):
+        self.upserts.append(points)
+
+    def scroll(self, collection, limit, offset=None, with_payload=True, with_vectors=False):
+        start = offset or 0
+        end = start + self.page_size
+        points = [SimpleNamespace(payload=payload) for payload in self.payloads[start:end]]
+        return points, end if end < len(self.payloads) else None
+
+
+def stored(source, digest, settings, chunk_count, chunks=None):
+    return [
+        {"metadata": {"source": source, "file_hash": digest, "settings": settings, "chunk_count": chunk_count}}
+        for _ in range(chunk_count if chunks is None else chunks)
+    ]
+
+
+def chunks(count):
+    return [(f"text {index}", {"page": 1}) for index in range(count)]
+
+
+def test_plan_changes_skips_unchanged_and_deletes_removed():
+    previous = {"same.pdf": "a", "changed.pdf": "b", "gone.pdf": "c", "partial.pdf": None}
+    current = {"same.pdf": "a", "changed.pdf": "B", "new.pdf": "d", "partial.pdf": "e"}
+    pending, removed = plan_changes(current, previous)
+    assert pending == ["changed.pdf", "new.pdf", "partial.pdf"]
+    assert removed == ["gone.pdf"]
+
+
+def test_plan_changes_full_reingests_everything_but_still_deletes_removed():
+    pending, removed = plan_changes({"same.pdf": "a"}, {"same.pdf": "a", "gone.pdf": "c"}, full=True)
+    assert pending == ["same.pdf"]
+    assert removed == ["gone.pdf"]
+
+
+def test_stored_files_only_trusts_complete_current_versions():
+    client = StubClient(
+        stored("complete.pdf", "h1", "key", 3)
+        + stored("partial.pdf", "h2", "key", 3, chunks=2)
+        + stored("old-settings.pdf", "h3", "other", 1)
+        + stored("two-versions.pdf", "h4", "key", 1)
+        + stored("two-versions.pdf", "h5", "key", 1)
+    )
+    assert stored_files(client, "crop_vector_db", "key") == {
+        "complete.pdf": "h1",
+        "partial.pdf": None,
+        "old-settings.pdf": None,
+        "two-versions.pdf": None,
+    }
+
+
+def test_stored_files_feeds_plan_changes_without_a_manifest():
+    client = StubClient(stored("kept.pdf", "h1", "key", 2) + stored("gone.pdf", "h2", "key", 1))
+    previous = stored_files(client, "crop_vector_db", "key")
+    pending, removed = plan_changes({"kept.pdf": "h1", "new.pdf": "h3"}, previous)
+    assert pending == ["new.pdf"]
+    assert removed == ["gone.pdf"]
+
+
+def test_source_filter_keeps_only_the_current_version():
+    condition = source_filter("a.pdf", keep_hash="h1", keep_settings="key")
+    assert condition.must[0].key == "metadata.source"
+    (keep,) = condition.must_not
+    assert {(c.key, c.match.value) for c in keep.must} == {
+        ("metadata.file_hash", "h1"),
+        ("metadata.settings", "key"),
+    }
+    assert source_filter("a.pdf").must_not is None
+
+
+def test_writer_completes_files_once_all_their_chunks_are_stored():
+    client = StubClient()
+    writer = Writer(client, "crop_vector_db", StubEmbeddings(), batch_size=3, settings_key="key")
+    assert writer.add_file("a.pdf", "h1", chunks(2)) == []
+    # The first batch holds both chunks of a.pdf and one of b.pdf
+    assert writer.add_file("b.pdf", "h2", chunks(3)) == ["a.pdf"]
+    assert writer.add_file("empty.pdf", "h3", []) == ["empty.pdf"]
+    assert writer.flush() == ["b.pdf"]
+    assert writer.flush() == []
+    assert [len(batch.ids) for batch in client.upserts] == [3, 2]
+    assert writer.chunks_written == 5
+
+
+def test_writer_point_ids_follow_content_and_settings():
+    def ids(digest, key):
+        client = StubClient()
+        writer = Writer(client, "crop_vector_db", StubEmbeddings(), batch_size=10, settings_key=key)
+        writer.add_file("a.pdf", digest, chunks(2))
+        writer.flush()
+        (batch,) = client.upserts
+        return batch.ids, batch.payloads
+
+    first, payloads = ids("h1", "key")
+    assert ids("h1", "key")[0] == first
+    assert not set(ids("h2", "key")[0]) & set(first)
+    assert not set(ids("h1", "other")[0]) & set(first)
+    assert payloads[1]["metadata"] == {
+        "page": 1, "source": "a.pdf", "file_hash": "h1", "settings": "key", "chunk": 1, "chunk_count": 2,
+    }
+
+
+def collection_info(dimension=768, on_disk=None, quantization=None):
+    return SimpleNamespace(config=SimpleNamespace(
+        params=SimpleNamespace(vectors=models.VectorParams(
+            size=dimension, distance=models.Distance.COSINE, on_disk=on_disk
+        )),
+        hnsw_config=SimpleNamespace(m=16, ef_construct=100, on_disk=False),
+        quantization_config=quantization,
+    ))
+
+
+def test_collection_matches_compares_the_stored_configuration():
+    options = storage_options(SimpleNamespace(
+        quantization="none", quantized_on_disk=False, on_disk=False, hnsw_m=None,
+        hnsw_ef_construct=None, hnsw_on_disk=False, payload_index=None,
+    ))
+    assert collection_matches(collection_info(), 768, options)
+    assert not collection_matches(collection_info(dimension=384), 768, options)
+    assert not collection_matches(collection_info(on_disk=True), 768, options)
+    scalar = models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
+    )
+    assert not collection_matches(collection_info(quantization=scalar), 768, options)
+    assert collection_matches(collection_info(quantization=scalar), 768, dict(options, quantization="scalar"))
+    assert not collection_matches(collection_info(), 768, dict(options, hnsw_m=32))
@@ -1,6 +1,34 @@
+import hashlib
+import io
+import itertools
+import json
+import os
+import queue
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 from PIL import Image
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Comma-separated list of inference servers; requests are spread round-robin
+# and fail over to the next server on connection errors. The survey page
+# posts to <url>/batch
+PREDICT_URLS = [
+    url.strip() for url in os.environ.get("PREDICT_URLS", "http://localhost:8001/predict").split(",") if url.strip()
+]
+REQUEST_TIMEOUT = (3.05, 30)  # connect, read (seconds)
+# Images are downscaled so their shorter side matches the model's Resize(256)
+UPLOAD_SIZE = 256
+# Plot survey: images per /predict/batch request, and requests in flight
+SURVEY_BATCH_SIZE = int(os.environ.get("SURVEY_BATCH_SIZE", "16"))
+SURVEY_CONCURRENCY = int(os.environ.get("SURVEY_CONCURRENCY", "4"))
+IMAGE_TYPES = ["jpg", "jpeg", "png"]
+VIDEO_TYPES = ["mp4", "mov", "avi", "mkv"]
 
 # Dictionary containing information for all diseases
 DISEASE_INFO = {
@@ -176,12 +204,179 @@ def get_disease_info(disease_name):
         "recommended_action": "Information not available."
     })
 
+class PredictionClient:
+    def __init__(self, urls):
+        self.urls = urls
+        self._order = itertools.cycle(range(len(urls)))
+        self._lock = threading.Lock()
+        # Retries also honour the server's Retry-After on 503 (overloaded or
+        # still loading the model)
+        retry = Retry(
+            total=2,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=len(urls), pool_maxsize=16, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _urls_from_next(self):
+        with self._lock:
+            start = next(self._order)
+        return self.urls[start:] + self.urls[:start]
+
+    def post(self, path_suffix="", **kwargs):
+        error = None
+        for url in self._urls_from_next():
+            try:
+                return self.session.post(url + path_suffix, timeout=REQUEST_TIMEOUT, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+        raise error
+
+    def predict(self, image_bytes, filename="image.jpg", **params):
+        return self.post(files={"file": (filename, image_bytes, "image/jpeg")}, params=params)
+
+@st.cache_resource
+def get_prediction_client():
+    # One pooled client per Streamlit server process, shared across reruns
+    return PredictionClient(PREDICT_URLS)
+
+def prepare_upload(image):
+    # Downscale to the model's input scale and re-encode, which shrinks the
+    # upload and the server's decode work
+    width, height = image.size
+    scale = UPLOAD_SIZE / min(width, height)
+    if scale < 1:
+        image.draft("RGB", (int(width * scale), int(height * scale)))
+        width, height = image.size
+        scale = UPLOAD_SIZE / min(width, height)
+    image = image.convert("RGB")
+    if scale < 1:
+        image = image.resize((round(width * scale), round(height * scale)), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def prepare_file_upload(data):
+    return prepare_upload(Image.open(io.BytesIO(data)))
+
+def file_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def saved_predictions():
+    # Results keyed by file (or frame) hash, kept for the whole browser
+    # session so reruns and page switches don't repeat inference
+    return st.session_state.setdefault("predictions", {})
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def sample_video_frames(data, suffix, every_seconds, max_frames):
+    # Returns [(seconds, jpeg bytes)]; cv2 is only needed for video uploads
+    import cv2
+
+    frames = []
+    with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+        f.write(data)
+        f.flush()
+        capture = cv2.VideoCapture(f.name)
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, round(fps * every_seconds))
+        index = 0
+        while len(frames) < max_frames and capture.grab():
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    frames.append((index / fps, prepare_upload(image)))
+            index += 1
+        capture.release()
+    return frames
+
+def survey_items(uploaded_files, every_seconds, max_frames):
+    # One item per image or sampled frame: key (content hash), display name
+    # and a callable returning the bytes to upload
+    items = []
+    for uploaded_file in uploaded_files:
+        data = uploaded_file.getvalue()
+        digest = file_digest(data)
+        extension = os.path.splitext(uploaded_file.name)[1].lower()
+        if extension.lstrip(".") in VIDEO_TYPES:
+            for seconds, frame in sample_video_frames(data, extension, every_seconds, max_frames):
+                items.append({
+                    "key": f"{digest}@{seconds:.2f}",
+                    "name": f"{uploaded_file.name} @ {seconds:.1f}s",
+                    "load": lambda frame=frame: frame,
+                })
+        else:
+            items.append({
+                "key": digest,
+                "name": uploaded_file.name,
+                "load": lambda data=data: prepare_file_upload(data),
+            })
+    return items
+
+def submit_survey_batch(client, batch, results):
+    # Runs on a worker thread; each streamed NDJSON line is handed to the
+    # page through the results queue as soon as it arrives
+    submitted, files = [], []
+    for item in batch:
+        # A file that can't be read as an image only fails itself
+        try:
+            files.append(("files", (item["name"], item["load"](), "image/jpeg")))
+        except Exception as e:
+            results.put((item, {"error": f"Could not read image: {e}"}))
+        else:
+            submitted.append(item)
+    if not submitted:
+        return
+
+    answered = set()
+    error = "No result returned"
+    try:
+        with client.post("/batch", files=files, stream=True) as response:
+            if response.status_code != 200:
+                raise requests.HTTPError(f"{response.status_code} - {response.text}")
+            for line in response.iter_lines():
+                if line:
+                    result = json.loads(line)
+                    if "index" in result:
+                        answered.add(result["index"])
+                        results.put((submitted[result["index"]], result))
+                    else:
+                        # A whole-request error (e.g. the upload could not be
+                        # read) applies to every image without its own result
+                        error = result.get("error", error)
+    except Exception as e:
+        error = str(e)
+    for index, item in enumerate(submitted):
+        if index not in answered:
+            results.put((item, {"error": error}))
+
+def render_survey(placeholder, items, predictions, errors):
+    counts = Counter(
+        predictions[item["key"]]["predicted_disease"] for item in items if item["key"] in predictions
+    )
+    with placeholder.container():
+        if counts:
+            st.subheader("Diseases across the plot")
+            st.bar_chart({"images": dict(counts.most_common())})
+            st.table([{"disease": disease, "images": count} for disease, count in counts.most_common()])
+        if errors:
+            st.warning(f"{len(errors)} images could not be analysed")
+            st.table(errors)
+
 def main():
     st.sidebar.title("Navigation")
-    page = st.sidebar.radio("Go to", ["Disease Prediction", "About Product", "About Developer"])
+    page = st.sidebar.radio("Go to", ["Disease Prediction", "Plot Survey", "About Product", "About Developer"])
 
     if page == "Disease Prediction":
         disease_prediction_page()
+    elif page == "Plot Survey":
+        plot_survey_page()
     elif page == "About Product":
         about_product_page()
     elif page == "About Developer":
@@ -196,27 +391,81 @@ def disease_prediction_page():
         image = Image.open(uploaded_file)
         st.image(image, caption='Uploaded Image', use_column_width=True)
         
-        byte_img = uploaded_file.getvalue()
-        response = requests.post("http://localhost:8001/predict", files={"file": byte_img})
+        data = uploaded_file.getvalue()
+        digest = file_digest(data)
+        predictions = saved_predictions()
+        if digest not in predictions:
+            try:
+                response = get_prediction_client().predict(prepare_file_upload(data), uploaded_file.name)
+            except requests.RequestException as e:
+                st.error(f"Could not reach the prediction server: {e}")
+                return
+            if response.status_code != 200:
+                st.write(f"Error: {response.status_code} - {response.text}")
+                return
+            predictions[digest] = response.json()
+
+        prediction = predictions[digest]["predicted_disease"]
+        st.write(f"Predicted disease: {prediction}")
         
-        if response.status_code == 200:
-            prediction = response.json()["predicted_disease"]
-            st.write(f"Predicted disease: {prediction}")
-            
-            disease_info = get_disease_info(prediction)
-            
-            st.subheader("Disease Information")
-            st.write(f"**Impact:** {disease_info['impact']}")
-            st.write(f"**Symptoms:** {disease_info['symptoms']}")
-            st.write(f"**Lifecycle:** {disease_info['lifecycle']}")
-            st.write(f"**Cause:** {disease_info['cause']}")
-            st.write(f"**Prevention:** {disease_info['prevention']}")
-            st.write(f"**Recommended Action:** {disease_info['recommended_action']}")
-        else:
-            st.write(f"Error: {response.status_code} - {response.text}")
+        disease_info = get_disease_info(prediction)
+        
+        st.subheader("Disease Information")
+        st.write(f"**Impact:** {disease_info['impact']}")
+        st.write(f"**Symptoms:** {disease_info['symptoms']}")
+        st.write(f"**Lifecycle:** {disease_info['lifecycle']}")
+        st.write(f"**Cause:** {disease_info['cause']}")
+        st.write(f"**Prevention:** {disease_info['prevention']}")
+        st.write(f"**Recommended Action:** {disease_info['recommended_action']}")
     else:
         st.write("Please upload an image for disease detection.")
 
+def plot_survey_page():
+    st.title("Plot Survey")
+    st.write("Upload photos of a tree row, or a video walking along it, to see which diseases occur across the plot.")
+
+    uploaded_files = st.file_uploader(
+        "Choose images or videos", type=IMAGE_TYPES + VIDEO_TYPES, accept_multiple_files=True
+    )
+    every_seconds = st.sidebar.number_input("Video: seconds between frames", 0.5, 30.0, 2.0, step=0.5)
+    max_frames = st.sidebar.number_input("Video: maximum frames per video", 1, 1000, 120)
+    if not uploaded_files:
+        st.write("Please upload images or a video for analysis.")
+        return
+
+    items = survey_items(uploaded_files, every_seconds, int(max_frames))
+    predictions = saved_predictions()
+    pending = [item for item in items if item["key"] not in predictions]
+    errors = []
+    summary = st.empty()
+    render_survey(summary, items, predictions, errors)
+
+    if pending:
+        progress = st.progress(0.0)
+        status = st.empty()
+        results = queue.Queue()
+        client = get_prediction_client()
+        with ThreadPoolExecutor(max_workers=SURVEY_CONCURRENCY) as pool:
+            for start in range(0, len(pending), SURVEY_BATCH_SIZE):
+                pool.submit(submit_survey_batch, client, pending[start:start + SURVEY_BATCH_SIZE], results)
+            for done in range(1, len(pending) + 1):
+                item, result = results.get()
+                if "error" in result:
+                    errors.append({"file": item["name"], "error": result["error"]})
+                else:
+                    predictions[item["key"]] = result
+                progress.progress(done / len(pending))
+                status.write(f"Analysed {done} of {len(pending)} images")
+                # Redraw the summary once per batch's worth of results
+                if done % SURVEY_BATCH_SIZE == 0 or done == len(pending):
+                    render_survey(summary, items, predictions, errors)
+
+    with st.expander(f"Results per image ({len(items)})"):
+        st.table([
+            {"file": item["name"], "predicted disease": predictions[item["key"]]["predicted_disease"]}
+            for item in items if item["key"] in predictions
+        ])
+
 def about_product_page():
     st.title("About Our Plant Disease Detection Product")
     